@@ -1,92 +1,570 @@
+import asyncio
+import base64
+import binascii
+import difflib
+import functools
 import json
-from typing import Any, Dict, List, Optional
-from backend.schemas import BrandProfile, PostVariant, Critique, JudgeResult
+import logging
+import os
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, get_args
+from backend.config import settings
+from backend.context import BudgetExceeded, PendingCall, current_call, current_run, estimate_tokens
+from pydantic import ValidationError
+from backend.schemas import BrandProfile, EventType, PostVariant, Critique, JudgeResult, JudgeMode
 from backend.prompts import (
     brand_inference_prompt,
     post_generation_prompt,
     critique_prompt,
     revise_prompt,
     judge_prompt,
+    judge_batch_prompt,
 )
-from backend.providers.factory import get_provider
+from backend import derivatives
+from backend.images import ImageStore, image_url, placeholder_svg
+from backend.metrics import PROVIDER_RECENT_SECONDS, current_stage, span, traced
+from backend.singleflight import SingleFlight
+from backend.validator import Violation, autofix, has_errors, validate_post
+from backend.providers.caching_provider import CachingProvider
+from backend.providers.factory import find_layer, shared_provider
 
-provider = get_provider()
+logger = logging.getLogger(__name__)
 
-def infer_brand(event: str) -> BrandProfile:
-    data = provider.generate_json(brand_inference_prompt(event))
-    return BrandProfile(**data)
+T = TypeVar("T")
 
-def generate_variants(intent: str, platform: str, event: str, brand: BrandProfile, n_variants: int = 3) -> List[PostVariant]:
-    brand_json = brand.model_dump_json(indent=2)
-    variants: List[PostVariant] = []
-    for k in range(1, n_variants + 1):
-        data = provider.generate_json(post_generation_prompt(intent, platform, event, brand_json, k))
-        variant = PostVariant(
+images = ImageStore(os.path.join(settings.data_dir, "images"))
+
+# Progress hook: awaited with (event_type, payload) as each stage of a variant completes.
+EventSink = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+# One semaphore per event loop caps in-flight model calls (settings.max_concurrency).
+_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _limit() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _limits.get(loop)
+    if sem is None:
+        sem = _limits[loop] = asyncio.Semaphore(max(1, settings.max_concurrency))
+    return sem
+
+# Identical prompts already in flight share one provider call, but only where the prompt cache would
+# return the same response for them anyway: this just covers the gap before the first one lands.
+# Stages the cache skips (drafting, revision) want independent samples, so they are never coalesced.
+_call_flights = SingleFlight("provider_call")
+_brand_flights = SingleFlight("infer_brand", share=lambda b: b.model_copy(deep=True))
+
+def _coalesce_calls() -> bool:
+    if not settings.singleflight_enabled:
+        return False
+    cache = find_layer(shared_provider(), CachingProvider)
+    return cache is not None and current_stage.get() not in cache.skip_stages
+
+@contextmanager
+def _charged(prompt: str) -> Iterator[Optional[PendingCall]]:
+    """Reserve one call (and the prompt's estimated tokens) against the run's budget for the block.
+
+    The reservation is refunded if no attempt reached the upstream provider, so
+    `usage` counts only calls that were actually made. A refunded call that
+    returned was served by the prompt cache or an identical in-flight call
+    (`cache_hits`); one that raised or was cancelled first is `rejected_calls`.
+    """
+    run = current_run.get()
+    if run is None:
+        yield None
+        return
+    pending = PendingCall(estimate_tokens(prompt))
+    if not run.charge(1, pending.tokens):
+        raise BudgetExceeded("model call budget exhausted")
+    token = current_call.set(pending)
+    ok = False
+    try:
+        yield pending
+        ok = True
+    finally:
+        current_call.reset(token)
+        if not pending.upstream:
+            run.refund(pending.tokens, served=ok)
+
+async def _provider_json(prompt: str) -> dict:
+    async with _limit():
+        return await shared_provider().agenerate_json(prompt)
+
+async def _provider_image(prompt: str) -> Optional[str]:
+    async with _limit():
+        return await shared_provider().agenerate_image_b64(prompt)
+
+async def _call_json(prompt: str) -> dict:
+    with _charged(prompt) as pending:
+        if _coalesce_calls():
+            data = await _call_flights.do(("json", prompt), lambda: _provider_json(prompt))
+        else:
+            data = await _provider_json(prompt)
+    run = current_run.get()
+    if run is not None and pending is not None and pending.upstream:
+        run.add_tokens(estimate_tokens(json.dumps(data, ensure_ascii=False)))
+    return data
+
+async def _call_image(prompt: str) -> Optional[str]:
+    with _charged(prompt):
+        if _coalesce_calls():
+            return await _call_flights.do(("image", prompt), lambda: _provider_image(prompt))
+        return await _provider_image(prompt)
+
+
+@dataclass(frozen=True)
+class ConvergencePolicy:
+    """When the critique/revise loop may stop before `max_iters`."""
+    max_iters: int = 2
+    min_score: int = 5  # every critique axis must reach this, with postability "yes", to stop early
+    stop_on_no_improvement: bool = True
+
+    def converged(self, c: Critique) -> bool:
+        axes = (c.brand_consistency, c.clarity, c.cta_strength, c.image_text_readability)
+        return c.postability == "yes" and min(axes) >= self.min_score
+
+
+def _critique_total(c: Critique) -> int:
+    return c.brand_consistency + c.clarity + c.cta_strength + c.image_text_readability + (1 if c.postability == "yes" else 0)
+
+# Deadline degradations, applied in this order as time runs out
+DEGRADE_CRITIQUE_ROUNDS = "critique_rounds_cut"  # no further critique/revise rounds
+DEGRADE_JUDGE = "judge_skipped"                  # rank by the latest critique instead
+DEGRADE_IMAGE = "placeholder_image"              # local placeholder instead of a generated image
+
+# Expected stage latency (s) until a stage has had successful upstream calls
+_STAGE_PRIOR_S = {"critique": 4.0, "revise": 4.0, "judge": 4.0, "judge_batch": 6.0, "image": 15.0}
+
+def expected_s(*stages: str) -> float:
+    # Recent upstream calls, not STAGE_SECONDS: stage spans include cache hits and cancelled work and never decay
+    return sum(PROVIDER_RECENT_SECONDS.mean(s) or _STAGE_PRIOR_S.get(s, 4.0) for s in stages)
+
+def fits_deadline(*stages: str) -> bool:
+    """True if the run has no deadline or enough time left for `stages` at their recent upstream latency."""
+    run = current_run.get()
+    left = run.time_left() if run is not None else None
+    return left is None or left >= expected_s(*stages)
+
+def degrade(step: str) -> None:
+    run = current_run.get()
+    if run is not None:
+        run.degrade(step)
+
+async def before_deadline(aw: Awaitable[T]) -> T:
+    """Await `aw`, cancelling it at the run's deadline (raises TimeoutError)."""
+    run = current_run.get()
+    left = run.time_left() if run is not None else None
+    if left is None:
+        return await aw
+    return await asyncio.wait_for(aw, max(0.0, left))
+
+def rank_score(post: PostVariant, by_critique: bool = False) -> float:
+    """Sort key for variants: judge score, or the latest critique once the judge was skipped."""
+    if by_critique:
+        return _critique_total(post.critiques[-1]) if post.critiques else 0
+    return post.judge.overall_score if post.judge else 0
+
+@traced("infer_brand")
+async def infer_brand(event: str) -> BrandProfile:
+    """Brand profile for `event`; concurrent requests for the same event share one inference."""
+    prompt = brand_inference_prompt(event)
+
+    async def infer() -> BrandProfile:
+        return BrandProfile(**await _call_json(prompt))
+
+    if not settings.singleflight_enabled:
+        return await infer()
+    return await _brand_flights.do(prompt, infer)
+
+async def warm_up() -> Dict[str, Any]:
+    """Startup hook: build the provider chain, open upstream connections and pull cached brand profiles into memory."""
+    provider = shared_provider()
+    await provider.awarm_up()
+    cache = find_layer(provider, CachingProvider)
+    preloaded = 0
+    if cache is not None:
+        # Brand inference is the first call of every request and its prompt only depends on the event
+        preloaded = cache.preload(cache.key("json", brand_inference_prompt(e)) for e in get_args(EventType))
+    return {"brand_profiles_preloaded": preloaded}
+
+def _compact(obj: Any) -> str:
+    # Prompt payloads are compact JSON: whitespace only costs input tokens
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+@functools.lru_cache(maxsize=1024)
+def _post_json_text(caption: str, text_overlay: str, image_prompt: str) -> str:
+    return _compact({"caption": caption, "text_overlay": text_overlay, "image_prompt": image_prompt})
+
+def _post_json(post: PostVariant) -> str:
+    # Critique, revise and judge of an unchanged post reuse one serialization
+    return _post_json_text(post.caption, post.text_overlay, post.image_prompt)
+
+@traced("generate_variants")
+async def generate_variants(intent: str, platform: str, event: str, brand: BrandProfile, n_variants: int = 3) -> List[PostVariant]:
+    brand_json = brand.prompt_json()
+
+    async def one(k: int) -> PostVariant:
+        data = await _call_json(post_generation_prompt(intent, platform, event, brand_json, k))
+        post = PostVariant(
             platform=platform,
             caption=data["caption"].strip(),
             text_overlay=data["text_overlay"].strip(),
             image_prompt=data["image_prompt"].strip(),
         )
-        variants.append(variant)
-    return variants
+        autofix(post)
+        return post
 
-def critique_post(platform: str, event: str, brand: BrandProfile, post: PostVariant) -> Critique:
-    brand_json = brand.model_dump_json(indent=2)
-    post_json = json.dumps(
-        {"caption": post.caption, "text_overlay": post.text_overlay, "image_prompt": post.image_prompt},
-        ensure_ascii=False,
-        indent=2,
-    )
-    data = provider.generate_json(critique_prompt(platform, event, brand_json, post_json))
+    return list(await asyncio.gather(*(one(k) for k in range(1, n_variants + 1))))
+
+@traced("critique")
+async def critique_post(platform: str, event: str, brand: BrandProfile, post: PostVariant) -> Critique:
+    brand_json = brand.prompt_json()
+    post_json = _post_json(post)
+    data = await _call_json(critique_prompt(platform, event, brand_json, post_json))
     return Critique(**data)
 
 
-def judge_post(platform: str, event: str, brand: BrandProfile, post: PostVariant) -> JudgeResult:
+@traced("judge")
+async def judge_post(platform: str, event: str, brand: BrandProfile, post: PostVariant) -> JudgeResult:
     """Independent scoring pass used to rank variants.
 
     This is intentionally a separate model call from the critique loop so that
     we can compare multiple variants with a consistent rubric.
     """
-    brand_json = brand.model_dump_json(indent=2)
-    post_json = json.dumps(
-        {"caption": post.caption, "text_overlay": post.text_overlay, "image_prompt": post.image_prompt},
-        ensure_ascii=False,
-        indent=2,
-    )
-    data = provider.generate_json(judge_prompt(platform, event, brand_json, post_json))
+    brand_json = brand.prompt_json()
+    post_json = _post_json(post)
+    data = await _call_json(judge_prompt(platform, event, brand_json, post_json))
     return JudgeResult(**data)
 
 
-def revise_post(event: str, platform: str, brand: BrandProfile, post: PostVariant, critique: Critique, human_feedback: Optional[str] = None) -> PostVariant:
-    brand_json = brand.model_dump_json(indent=2)
-    post_json = json.dumps(
-        {"caption": post.caption, "text_overlay": post.text_overlay, "image_prompt": post.image_prompt},
-        ensure_ascii=False,
-        indent=2,
-    )
-    critique_json = critique.model_dump_json(indent=2)
-    data = provider.generate_json(revise_prompt(event, platform, brand_json, post_json, critique_json, human_feedback))
+@traced("judge_batch")
+async def judge_batch(platform: str, event: str, brand: BrandProfile, posts: List[PostVariant]) -> List[JudgeResult]:
+    """Listwise judge: one call scores every post against the same rubric.
+
+    Raises ValueError if the response does not contain exactly one valid result per post.
+    """
+    brand_json = brand.prompt_json()
+    posts_json = _compact([
+        {"index": i, "caption": p.caption, "text_overlay": p.text_overlay, "image_prompt": p.image_prompt}
+        for i, p in enumerate(posts)
+    ])
+    data = await _call_json(judge_batch_prompt(platform, event, brand_json, posts_json, len(posts)))
+    results = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(results, list):
+        raise ValueError("batched judge response has no 'results' list")
+    by_index: Dict[int, JudgeResult] = {}
+    for item in results:
+        if not isinstance(item, dict):
+            raise ValueError("batched judge result is not an object")
+        idx = item.get("index")
+        if not isinstance(idx, int) or not 0 <= idx < len(posts) or idx in by_index:
+            raise ValueError(f"batched judge returned bad index: {idx!r}")
+        try:
+            by_index[idx] = JudgeResult(**{k: v for k, v in item.items() if k != "index"})
+        except ValidationError as e:
+            raise ValueError(f"batched judge result {idx} is invalid: {e}") from e
+    if len(by_index) != len(posts):
+        raise ValueError(f"batched judge scored {len(by_index)} of {len(posts)} posts")
+    return [by_index[i] for i in range(len(posts))]
+
+
+@traced("revise")
+async def revise_post(event: str, platform: str, brand: BrandProfile, post: PostVariant, critique: Optional[Critique], human_feedback: Optional[str] = None, violations: Optional[List[Violation]] = None) -> PostVariant:
+    """Revise from an LLM critique and/or local rule violations (either may be omitted)."""
+    brand_json = brand.prompt_json()
+    post_json = _post_json(post)
+    critique_json = critique.model_dump_json() if critique else None
+    violations_json = _compact([v.to_dict() for v in violations]) if violations else None
+    data = await _call_json(revise_prompt(event, platform, brand_json, post_json, critique_json, human_feedback, violations_json))
     post.caption = data["caption"].strip()
     post.text_overlay = data["text_overlay"].strip()
     post.image_prompt = data["image_prompt"].strip()
+    autofix(post)
     return post
 
-def attach_background_image(post: PostVariant) -> PostVariant:
-    # Generate a background image (or mock placeholder) and attach base64 string
-    b64 = provider.generate_image_b64(post.image_prompt)
-    post.background_image_b64 = b64
+async def _render_image(prompt: str) -> Optional[str]:
+    # A prompt that was already rendered is served from the store without another image call.
+    # Store reads and writes (files, SQLite) run in a worker thread, off the event loop.
+    image_hash = await asyncio.to_thread(images.lookup_prompt, prompt)
+    if image_hash is None:
+        b64 = await _call_image(prompt)
+        image_hash = await asyncio.to_thread(images.put_b64, b64, prompt=prompt) if b64 else None
+    return image_hash
+
+def _set_image(post: PostVariant, image_hash: Optional[str]) -> PostVariant:
+    post.image_id = image_hash
+    post.image_url = image_url(image_hash) if image_hash else None
+    post.background_image_b64 = None
     return post
 
-def agentic_self_feedback_loop(event: str, platform: str, brand: BrandProfile, post: PostVariant, n_iters: int = 2) -> PostVariant:
-    for _ in range(n_iters):
-        c = critique_post(platform, event, brand, post)
+@traced("image")
+async def attach_background_image(post: PostVariant) -> PostVariant:
+    # Generate a background image (or mock placeholder) into the image store and attach a reference.
+    return _set_image(post, await _render_image(post.image_prompt))
+
+async def attach_placeholder_image(post: PostVariant) -> PostVariant:
+    degrade(DEGRADE_IMAGE)
+    return _set_image(post, await asyncio.to_thread(images.put_bytes, placeholder_svg(post.text_overlay)))
+
+async def attach_image_within_deadline(post: PostVariant) -> PostVariant:
+    """attach_background_image, or a placeholder if the deadline leaves no time for it (BudgetExceeded still propagates)."""
+    if await asyncio.to_thread(images.lookup_prompt, post.image_prompt) is None and not fits_deadline("image"):
+        return await attach_placeholder_image(post)
+    try:
+        return await before_deadline(attach_background_image(post))
+    except asyncio.TimeoutError:
+        return await attach_placeholder_image(post)
+
+# Speculative images are kept when the final image_prompt is at least this similar to the draft's
+SPECULATIVE_IMAGE_MIN_SIMILARITY = 0.8
+
+def prompt_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the lowercased word sets (1.0 = same words)."""
+    wa, wb = set(a.lower().split()), set(b.lower().split())
+    if not wa and not wb:
+        return 1.0
+    return len(wa & wb) / len(wa | wb)
+
+# Refinements whose caption+overlay stay at least this similar count as minor text edits
+MINOR_EDIT_SIMILARITY = 0.9
+
+def text_similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+def diff_post(before: PostVariant, after: PostVariant) -> Dict[str, Any]:
+    """What a revision actually changed, used to skip unneeded refine stages."""
+    text_sim = text_similarity(f"{before.caption}\n{before.text_overlay}", f"{after.caption}\n{after.text_overlay}")
+    image_sim = prompt_similarity(before.image_prompt, after.image_prompt)
+    return {
+        "caption_changed": before.caption != after.caption,
+        "text_overlay_changed": before.text_overlay != after.text_overlay,
+        "image_prompt_changed": before.image_prompt != after.image_prompt,
+        "text_similarity": round(text_sim, 3),
+        "image_prompt_similarity": round(image_sim, 3),
+        "minor_text_edit": text_sim >= MINOR_EDIT_SIMILARITY,
+        "image_prompt_kept": image_sim >= SPECULATIVE_IMAGE_MIN_SIMILARITY,
+    }
+
+async def existing_image(post: PostVariant) -> Optional[str]:
+    """Hash of the image `post` already has in the store (adopting a legacy inline base64 image), if any."""
+    if post.image_id and await asyncio.to_thread(images.find, post.image_id):
+        return post.image_id
+    if post.background_image_b64:
+        # Client-supplied bytes: re-encoded through Pillow (never stored as SVG) and not bound to
+        # image_prompt, so an upload cannot replace the image /generate reuses for that prompt
+        try:
+            data = await derivatives.sanitize_upload(base64.b64decode(post.background_image_b64, validate=True))
+        except (binascii.Error, ValueError, OSError) as e:
+            logger.info("ignoring client-supplied image: %s", e)
+            return None
+        return await asyncio.to_thread(images.put_bytes, data)
+    return None
+
+def keep_image(post: PostVariant, image_hash: str) -> PostVariant:
+    return _set_image(post, image_hash)
+
+async def _speculative_image(prompt: str) -> Optional[str]:
+    async with span("image_speculative"):
+        return await _render_image(prompt)
+
+def _restore(post: PostVariant, text: Tuple[str, str, str], brand: BrandProfile) -> bool:
+    """Put `text` (caption, overlay, image prompt) back into `post`, re-applying autofix(). Refused (False) when
+    that would bring back a hard rule violation the current text no longer has, e.g. one a rule-only round fixed."""
+    candidate = post.model_copy(update=dict(zip(("caption", "text_overlay", "image_prompt"), text)))
+    autofix(candidate)
+    if has_errors(validate_post(candidate, brand)) and not has_errors(validate_post(post, brand)):
+        return False
+    post.caption, post.text_overlay, post.image_prompt = candidate.caption, candidate.text_overlay, candidate.image_prompt
+    return True
+
+
+@traced("feedback_loop")
+async def agentic_self_feedback_loop(event: str, platform: str, brand: BrandProfile, post: PostVariant, n_iters: int = 2, on_event: Optional[EventSink] = None, policy: Optional[ConvergencePolicy] = None) -> PostVariant:
+    """Critique -> revise rounds until the policy says stop, max_iters is hit, or the budget runs out.
+
+    Each round first runs the local rule validator. Hard rule violations that
+    autofix() cannot repair are sent straight to a revision, skipping the LLM
+    critique for that round; remaining warnings ride along with the critique.
+    """
+    policy = policy or ConvergencePolicy(max_iters=n_iters)
+    run = current_run.get()
+    prev: Optional[Critique] = None
+    before_revision = None
+    last_rule_round = None
+    for i in range(1, policy.max_iters + 1):
+        # Later rounds must leave time for the image and judge, which are degraded only after them
+        if i > 1 and not fits_deadline("critique", "revise", "image", "judge"):
+            degrade(DEGRADE_CRITIQUE_ROUNDS)
+            break
+        autofix(post)
+        violations = validate_post(post, brand)
+        rules = {(v.rule, v.message) for v in violations if v.severity == "error"}
+        remaining = run.remaining_calls() if run is not None else None
+        if rules and rules != last_rule_round:
+            # Mechanical violations: revise from the rules alone (one call instead of two)
+            if remaining is not None and remaining < 1:
+                break
+            last_rule_round = rules
+            if on_event:
+                await on_event("validation", {"round": i, "violations": [v.to_dict() for v in violations]})
+            try:
+                post = await before_deadline(revise_post(event, platform, brand, post, None, violations=violations))
+            except BudgetExceeded:
+                break
+            except asyncio.TimeoutError:
+                degrade(DEGRADE_CRITIQUE_ROUNDS)
+                break
+            if on_event:
+                await on_event("revision", {"round": i, "caption": post.caption, "text_overlay": post.text_overlay, "image_prompt": post.image_prompt})
+            continue
+
+        # A round is critique + revise; don't start one the budget cannot finish
+        if remaining is not None and remaining < 2:
+            break
+        try:
+            c = await before_deadline(critique_post(platform, event, brand, post))
+        except BudgetExceeded:
+            break
+        except asyncio.TimeoutError:
+            degrade(DEGRADE_CRITIQUE_ROUNDS)
+            break
         post.critiques.append(c)
-        post = revise_post(event, platform, brand, post, c)
+        if run is not None:
+            run.critique_rounds += 1
+        if on_event:
+            await on_event("critique", {"round": i, "critique": c.model_dump()})
+        if policy.converged(c) and not has_errors(violations):
+            break
+        if prev is not None and policy.stop_on_no_improvement and _critique_total(c) <= _critique_total(prev):
+            if _critique_total(c) < _critique_total(prev) and _restore(post, before_revision, brand):
+                # Last revision made things worse: back to the text `prev` scored, so drop the critique of the
+                # discarded text (it would otherwise rank the variant and count as an iteration)
+                post.critiques.pop()
+                if on_event:
+                    await on_event("revision", {"round": i, "caption": post.caption, "text_overlay": post.text_overlay, "image_prompt": post.image_prompt})
+            break
+        before_revision = (post.caption, post.text_overlay, post.image_prompt)
+        try:
+            post = await before_deadline(revise_post(event, platform, brand, post, c, violations=violations or None))
+        except BudgetExceeded:
+            break
+        except asyncio.TimeoutError:
+            degrade(DEGRADE_CRITIQUE_ROUNDS)
+            break
+        if on_event:
+            await on_event("revision", {"round": i, "caption": post.caption, "text_overlay": post.text_overlay, "image_prompt": post.image_prompt})
+        prev = c
+    post.violations = [v.to_dict() for v in validate_post(post, brand)]
     return post
 
 
-def score_variants(event: str, platform: str, brand: BrandProfile, variants: List[PostVariant]) -> List[PostVariant]:
-    """Attach judge scores to each variant."""
-    for v in variants:
-        v.judge = judge_post(platform, event, brand, v)
+async def improve_variant(event: str, platform: str, brand: BrandProfile, post: PostVariant, n_iters: int = 2, on_event: Optional[EventSink] = None, policy: Optional[ConvergencePolicy] = None, speculative_image: bool = False) -> PostVariant:
+    """Critique/revise loop followed by the background image: one variant's critical path.
+
+    With `speculative_image`, the draft's image starts rendering alongside the
+    critique loop and is kept if the revisions leave image_prompt (nearly)
+    unchanged, so the path costs max(loop, image) instead of loop + image.
+    """
+    speculative = None
+    draft_prompt = post.image_prompt
+    if speculative_image:
+        speculative = asyncio.create_task(_speculative_image(draft_prompt))
+        # Mark failures as retrieved: a discarded speculation should not log "exception never retrieved"
+        speculative.add_done_callback(lambda t: t.cancelled() or t.exception())
+    try:
+        post = await agentic_self_feedback_loop(event, platform, brand, post, n_iters=n_iters, on_event=on_event, policy=policy)
+    except BaseException:
+        if speculative is not None:
+            speculative.cancel()
+        raise
+
+    run = current_run.get()
+    image_hash = None
+    if speculative is not None:
+        if prompt_similarity(draft_prompt, post.image_prompt) >= SPECULATIVE_IMAGE_MIN_SIMILARITY:
+            try:
+                image_hash = await before_deadline(speculative)
+            except BudgetExceeded:
+                return post
+            except asyncio.TimeoutError:
+                post = await attach_placeholder_image(post)
+            except Exception as e:
+                logger.warning("speculative image failed, rendering final prompt instead: %s", e)
+        else:
+            speculative.cancel()
+        if run is not None:
+            run.speculative_images["used" if image_hash else "discarded"] += 1
+    try:
+        if image_hash:
+            post = _set_image(post, image_hash)
+        elif not post.image_id:
+            post = await attach_image_within_deadline(post)
+    except BudgetExceeded:
+        return post
+    if on_event:
+        await on_event("image", {"image_id": post.image_id, "image_url": post.image_url})
+    return post
+
+
+@traced("score_variants")
+async def score_variants(event: str, platform: str, brand: BrandProfile, variants: List[PostVariant], on_event: Optional[EventSink] = None, mode: JudgeMode = "per_variant", gate: bool = False) -> List[PostVariant]:
+    """Attach judge scores to each variant.
+
+    mode="batch" scores all variants in one listwise call and falls back to
+    per-variant calls if that response cannot be parsed. With `gate`, variants
+    that still break a hard rule after autofix() are not sent to the judge
+    (they keep judge=None, rank last and are listed in run.judge_gated); if
+    that would leave nothing to judge, all variants are judged. If the run's
+    deadline leaves no time for judging, it is skipped and recorded as a degradation.
+    """
+    eligible = []
+    for i, v in enumerate(variants):
+        autofix(v)
+        violations = validate_post(v, brand)
+        v.violations = [x.to_dict() for x in violations]
+        if not (gate and has_errors(violations)):
+            eligible.append(i)
+    if not eligible:
+        # A gate that rejects everything would leave the ranking arbitrary
+        eligible = list(range(len(variants)))
+    elif len(eligible) < len(variants):
+        run = current_run.get()
+        if run is not None:
+            run.judge_gated = [i for i in range(len(variants)) if i not in eligible]
+
+    batched = mode == "batch" and len(eligible) > 1
+    if eligible and not fits_deadline("judge_batch" if batched else "judge"):
+        degrade(DEGRADE_JUDGE)
+        return variants
+
+    if batched:
+        try:
+            judges = await before_deadline(judge_batch(platform, event, brand, [variants[i] for i in eligible]))
+        except BudgetExceeded:
+            return variants
+        except asyncio.TimeoutError:
+            degrade(DEGRADE_JUDGE)
+            return variants
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("batched judge failed, falling back to per-variant calls: %s", e)
+        else:
+            for i, j in zip(eligible, judges):
+                variants[i].judge = j
+                if on_event:
+                    await on_event("judge", {"index": i, "judge": j.model_dump()})
+            return variants
+
+    async def one(i: int, v: PostVariant) -> None:
+        try:
+            v.judge = await before_deadline(judge_post(platform, event, brand, v))
+        except BudgetExceeded:
+            return
+        except asyncio.TimeoutError:
+            degrade(DEGRADE_JUDGE)
+            return
+        if on_event:
+            await on_event("judge", {"index": i, "judge": v.judge.model_dump()})
+
+    await asyncio.gather(*(one(i, variants[i]) for i in eligible))
     return variants
@@ -1,11 +1,59 @@
 import os
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass(frozen=True)
 class Settings:
-    ai_provider: str = os.getenv("AI_PROVIDER", "mock").lower()  # "mock" or "openai"
+    ai_provider: str = os.getenv("AI_PROVIDER", "mock").lower()  # "mock", "openai", "simulated" or "replay"
     openai_text_model: str = os.getenv("OPENAI_TEXT_MODEL", "gpt-5.2")
     openai_image_model: str = os.getenv("OPENAI_IMAGE_MODEL", "gpt-image-1")
+    openai_fast_text_model: str = os.getenv("OPENAI_FAST_TEXT_MODEL", "")  # optional cheaper model for the "fast" backend
     openai_timeout_s: int = int(os.getenv("OPENAI_TIMEOUT_S", "60"))
+    sim_text_latency: str = os.getenv("SIM_TEXT_LATENCY", "lognormal:1500:0.4")  # ms; fixed:N | uniform:LO:HI | lognormal:MEDIAN:SIGMA
+    sim_image_latency: str = os.getenv("SIM_IMAGE_LATENCY", "lognormal:8000:0.3")
+    sim_fast_text_latency: str = os.getenv("SIM_FAST_TEXT_LATENCY", "")  # set to add a simulated "fast" backend
+    sim_error_rate: float = float(os.getenv("SIM_ERROR_RATE", "0"))
+    sim_timeout_rate: float = float(os.getenv("SIM_TIMEOUT_RATE", "0"))
+    sim_seed: Optional[int] = int(os.environ["SIM_SEED"]) if os.getenv("SIM_SEED") else None
+    record_path: str = os.getenv("RECORD_PATH", "")  # append every upstream call (and each request body) to this JSONL call log
+    record_images: bool = os.getenv("RECORD_IMAGES", "0").lower() in ("1", "true", "yes")  # also keep image bytes in the log
+    replay_path: str = os.getenv("REPLAY_PATH", "")  # call log served by AI_PROVIDER=replay
+    replay_timing: str = os.getenv("REPLAY_TIMING", "none")  # "none" or "recorded" (sleep each call's recorded latency)
+    replay_speed: float = float(os.getenv("REPLAY_SPEED", "1"))  # multiplier on recorded latencies
+    replay_strict: bool = os.getenv("REPLAY_STRICT", "0").lower() in ("1", "true", "yes")  # unrecorded prompts fail instead of getting mock output
+    data_dir: str = os.getenv("DATA_DIR", ".data")  # local SQLite stores live here
+    cache_enabled: bool = os.getenv("PROVIDER_CACHE", "1").lower() in ("1", "true", "yes")
+    cache_max_entries: int = int(os.getenv("PROVIDER_CACHE_MAX_ENTRIES", "256"))
+    cache_ttl_s: int = int(os.getenv("PROVIDER_CACHE_TTL_S", str(7 * 24 * 3600)))
+    cache_max_mb: int = int(os.getenv("PROVIDER_CACHE_MAX_MB", "512"))
+    cache_skip_stages: str = os.getenv("PROVIDER_CACHE_SKIP_STAGES", "generate_variants,revise")  # stages whose calls are never cached
+    resilience_enabled: bool = os.getenv("PROVIDER_RESILIENCE", "1").lower() in ("1", "true", "yes")
+    provider_rps: float = float(os.getenv("PROVIDER_RPS", "0"))  # token-bucket rate; 0 = unlimited
+    provider_burst: int = int(os.getenv("PROVIDER_BURST", "10"))
+    provider_max_inflight: int = int(os.getenv("PROVIDER_MAX_INFLIGHT", "16"))
+    provider_max_retries: int = int(os.getenv("PROVIDER_MAX_RETRIES", "3"))
+    shared_rate_limit: bool = os.getenv("PROVIDER_SHARED_RATE_LIMIT", "1").lower() in ("1", "true", "yes")  # one PROVIDER_RPS bucket for all workers (SQLite under DATA_DIR)
+    provider_backoff_s: float = float(os.getenv("PROVIDER_BACKOFF_S", "0.5"))
+    provider_backoff_max_s: float = float(os.getenv("PROVIDER_BACKOFF_MAX_S", "8"))
+    breaker_failures: int = int(os.getenv("BREAKER_FAILURES", "5"))
+    breaker_reset_s: float = float(os.getenv("BREAKER_RESET_S", "30"))
+    provider_routes: str = os.getenv("PROVIDER_ROUTES", "")  # stage=backend[|hedge backend],...; default sends critique/judge to "fast" if configured
+    hedge_percentile: float = float(os.getenv("HEDGE_PERCENTILE", "95"))  # hedge calls slower than this backend percentile; 0 = off
+    hedge_min_s: float = float(os.getenv("HEDGE_MIN_S", "0.5"))
+    hedge_min_samples: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    hedge_max_ratio: float = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))  # at most this share of calls get a hedge
+    mock_fallback: bool = os.getenv("PROVIDER_MOCK_FALLBACK", "0").lower() in ("1", "true", "yes")  # serve mock output when the provider fails
+    max_concurrency: int = int(os.getenv("MAX_CONCURRENCY", "8"))  # max in-flight model calls per worker
+    variant_store_max_entries: int = int(os.getenv("VARIANT_STORE_MAX_ENTRIES", "1000"))
+    variant_store_max_rows: int = int(os.getenv("VARIANT_STORE_MAX_ROWS", "100000"))  # SQLite rows kept (variants still referenced are never pruned)
+    variant_store_ttl_s: float = float(os.getenv("VARIANT_STORE_TTL_S", str(30 * 24 * 3600)))
+    variant_store_persist: bool = os.getenv("VARIANT_STORE_PERSIST", "1").lower() in ("1", "true", "yes")  # back the LRU with SQLite
+    image_workers: int = int(os.getenv("IMAGE_WORKERS", "2"))  # processes rendering previews/WebP/composited posts
+    job_workers: int = int(os.getenv("JOB_WORKERS", "2"))  # concurrent background generations
+    job_lease_s: float = float(os.getenv("JOB_LEASE_S", "30"))  # a running job whose worker stops renewing this long is picked up again
+    job_poll_s: float = float(os.getenv("JOB_POLL_S", "1"))  # how often idle workers look for jobs queued by other processes
+    warmup: bool = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")  # build the provider, preconnect and preload brand profiles at startup
+    singleflight_enabled: bool = os.getenv("SINGLEFLIGHT", "1").lower() in ("1", "true", "yes")  # coalesce identical in-flight work
+    batch_concurrency: int = int(os.getenv("BATCH_CONCURRENCY", "8"))  # batch items in flight at once (model calls stay capped by MAX_CONCURRENCY)
 
 settings = Settings()
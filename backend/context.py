@@ -0,0 +1,135 @@
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class BudgetExceeded(RuntimeError):
+    """A required model call would exceed the request's call/token budget."""
+
+
+# Word runs, digit runs, single punctuation marks and line breaks (with their indentation)
+_TOKEN_PIECES = re.compile(r"[^\W\d_]+|\d+|\n[ \t]*|[^\w\s]|_")
+
+
+def estimate_tokens(text: str) -> int:
+    """Local approximation of a BPE tokenizer (cl100k/o200k-like), within ~10-15% on English prose and JSON.
+
+    Common words up to ~6 letters are one token and longer ones about one per 6 letters,
+    digits go in groups of 3, and each punctuation mark and line break (with its
+    indentation) is one token; single spaces ride along with the following word.
+    """
+    n = 0
+    for m in _TOKEN_PIECES.finditer(text):
+        piece = m.group()
+        if piece[0].isdigit():
+            n += (len(piece) + 2) // 3
+        elif piece[0].isalpha():
+            n += (len(piece) + 5) // 6
+        else:
+            n += 1
+    return max(1, n)
+
+
+@dataclass
+class RunContext:
+    """Per-request bookkeeping shared by every stage of one pipeline run.
+
+    Lives in a ContextVar so concurrently running stages (asyncio.gather copies
+    the context) all charge the same budget without threading it through every call.
+    """
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)  # ties recorded provider calls to their request
+    max_calls: Optional[int] = None
+    max_tokens: Optional[int] = None
+    calls: int = 0
+    tokens: int = 0
+    cache_hits: int = 0  # calls answered by the prompt cache or an identical in-flight call: not charged
+    rejected_calls: int = 0  # calls that failed or were cancelled before reaching the provider (open circuit, deadline): not charged
+    critique_rounds: int = 0
+    budget_exhausted: bool = False
+    started: float = field(default_factory=time.perf_counter)
+    spans: List[Dict[str, Any]] = field(default_factory=list)  # filled by metrics.span()
+    speculative_images: Dict[str, int] = field(default_factory=lambda: {"used": 0, "discarded": 0})
+    deadline: Optional[float] = None  # perf_counter() time by which the response is due
+    degradations: List[str] = field(default_factory=list)  # steps skipped to meet the deadline, in the order applied
+    judge_gated: List[int] = field(default_factory=list)  # indices (as passed to score_variants) not judged for hard rule violations
+
+    def remaining_calls(self) -> Optional[int]:
+        return None if self.max_calls is None else max(0, self.max_calls - self.calls)
+
+    def charge(self, n: int = 1, tokens: int = 0) -> bool:
+        """Reserve `n` calls and their estimated prompt `tokens` up front. Returns False (and charges nothing) if they don't fit."""
+        over_calls = self.max_calls is not None and self.calls + n > self.max_calls
+        over_tokens = self.max_tokens is not None and self.tokens + tokens > self.max_tokens
+        if over_calls or over_tokens:
+            self.budget_exhausted = True
+            return False
+        self.calls += n
+        self.tokens += tokens
+        return True
+
+    def refund(self, tokens: int = 0, served: bool = True) -> None:
+        """Give back one reserved call that never reached the upstream: `served` from the cache or a
+        coalesced call, or else rejected/cancelled before it was sent."""
+        self.calls -= 1
+        self.tokens -= tokens
+        if served:
+            self.cache_hits += 1
+        else:
+            self.rejected_calls += 1
+
+    def add_tokens(self, n: int) -> None:
+        self.tokens += n
+
+    def time_left(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.perf_counter()
+
+    def degrade(self, step: str) -> None:
+        if step not in self.degradations:
+            self.degradations.append(step)
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "model_calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "rejected_calls": self.rejected_calls,
+            "estimated_tokens": self.tokens,
+            "critique_rounds": self.critique_rounds,
+            "max_calls": self.max_calls,
+            "max_tokens": self.max_tokens,
+            "budget_exhausted": self.budget_exhausted,
+            "speculative_images": dict(self.speculative_images),
+            "degradations": list(self.degradations),
+        }
+
+
+current_run: ContextVar[Optional[RunContext]] = ContextVar("current_run", default=None)
+
+
+@dataclass
+class PendingCall:
+    """One charged model call; `upstream` is set once any provider attempt for it actually goes out."""
+    tokens: int
+    upstream: bool = False
+
+
+# Set around each charged call. Tasks started for it (singleflight, hedges) copy the context and so share the object.
+current_call: ContextVar[Optional[PendingCall]] = ContextVar("current_call", default=None)
+
+
+def mark_upstream_call() -> None:
+    call = current_call.get()
+    if call is not None:
+        call.upstream = True
+
+
+@contextmanager
+def run_context(run: RunContext) -> Iterator[RunContext]:
+    token = current_run.set(run)
+    try:
+        yield run
+    finally:
+        current_run.reset(token)
@@ -0,0 +1,109 @@
+"""Cached image derivatives: previews, WebP/PNG re-encodes and composited posts.
+
+Rendering (backend/imaging.py) runs in a process pool so Pillow never blocks
+the event loop. imaging is imported on first use, so starting the server does
+not load Pillow. Results go into the content-addressed ImageStore under a key
+built from the source hash and the render spec, so each derivative is rendered
+once per host and then served like any other stored image.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Sequence
+from backend.config import settings
+from backend.images import ImageStore
+from backend.metrics import span
+from backend.schemas import BrandProfile
+from backend.singleflight import SingleFlight, request_key
+
+# Bump when imaging output changes so stale derivatives are not served
+RENDER_VERSION = 1
+SIZES = ("preview", "full")
+FORMATS = ("webp", "png")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_flights = SingleFlight("image_derivative", share=lambda image_hash: image_hash)
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: workers must not inherit the server's threads, sockets and SQLite handles
+                _pool = ProcessPoolExecutor(max_workers=max(1, settings.image_workers), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _reset(broken: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        # Another caller may already have replaced it
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run `fn(*args)` in the pool. A worker that died (OOM kill, segfault in a codec) breaks the whole
+    executor for good, so the pool is rebuilt and the call retried once."""
+    loop = asyncio.get_running_loop()
+    pool = _executor()
+    try:
+        return await loop.run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        _reset(pool)
+        return await loop.run_in_executor(_executor(), fn, *args)
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def brand_colors(brand: Optional[BrandProfile]) -> List[str]:
+    colors: Any = brand.visual_identity.get("colors") if brand is not None else None
+    if isinstance(colors, str):
+        colors = colors.split(",")
+    return [str(c).strip() for c in colors or [] if str(c).strip()]
+
+
+async def sanitize_upload(data: bytes) -> bytes:
+    """Client-supplied image bytes re-encoded as PNG in the pool (see imaging.sanitize_upload)."""
+    from backend import imaging
+
+    return await _run(imaging.sanitize_upload, data)
+
+
+async def derivative(
+    store: ImageStore,
+    image_hash: str,
+    size: str = "preview",
+    fmt: str = "webp",
+    overlay: Optional[str] = None,
+    colors: Sequence[str] = (),
+) -> Optional[str]:
+    """Hash of the derivative of stored image `image_hash`, rendering it on first request; None if the source is unknown."""
+    found = await asyncio.to_thread(store.find, image_hash)
+    if found is None:
+        return None
+    spec_key = request_key("derivative", RENDER_VERSION, image_hash, size, fmt, overlay or "", list(colors))
+    cached = await asyncio.to_thread(store.lookup_derived, spec_key)
+    if cached is not None:
+        return cached
+
+    async def build() -> str:
+        from backend import imaging
+
+        async with span("image_derivative"):
+            data = await _run(imaging.render_file, found[0], size, fmt, overlay, tuple(colors))
+        return await asyncio.to_thread(store.put_derived, spec_key, data)
+
+    # Concurrent requests for the same derivative (e.g. a page of previews reloaded) render it once
+    return await _flights.do(spec_key, build)
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import threading
+from typing import Optional, Tuple
+
+_HASH = re.compile(r"^[0-9a-f]{64}$")
+
+def sniff_media_type(data: bytes) -> Tuple[str, str]:
+    """(media type, file extension) for the image formats providers return."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", "png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg", "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    if b"<svg" in data[:512]:
+        return "image/svg+xml", "svg"
+    return "application/octet-stream", "bin"
+
+
+def placeholder_svg(text: str, background: str = "#111111", accent: str = "#F5C518") -> bytes:
+    """Plain local background used when there is no time left to render a real image."""
+    safe = html.escape(text)
+    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="1024" height="1024">
+  <rect width="100%" height="100%" fill="{background}"/>
+  <rect x="80" y="80" width="864" height="864" fill="{accent}" opacity="0.12"/>
+  <text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" font-family="Arial" font-size="52" fill="#FFFFFF">{safe}</text>
+</svg>""".encode("utf-8")
+
+
+class ImageStore:
+    """Content-addressed image files on disk, keyed by sha256 of the bytes.
+
+    Identical images are stored once, and `image_prompt -> hash` is remembered so a
+    repeated prompt does not need another image call.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS prompts (prompt_key TEXT PRIMARY KEY, image_hash TEXT NOT NULL)")
+        # Derivative spec (source hash, size, format, overlay...) -> hash of the rendered bytes
+        self._db.execute("CREATE TABLE IF NOT EXISTS derivatives (spec_key TEXT PRIMARY KEY, image_hash TEXT NOT NULL)")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prompt_key(prompt: str, size: str) -> str:
+        return hashlib.sha256(f"{size}\n{prompt.strip()}".encode("utf-8")).hexdigest()
+
+    def _path(self, image_hash: str, ext: str) -> str:
+        return os.path.join(self.root, image_hash[:2], f"{image_hash}.{ext}")
+
+    def put_bytes(self, data: bytes) -> str:
+        image_hash = hashlib.sha256(data).hexdigest()
+        _, ext = sniff_media_type(data)
+        path = self._path(image_hash, ext)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)  # atomic, so readers never see a partial file
+        return image_hash
+
+    def put_b64(self, b64: str, prompt: Optional[str] = None, size: str = "1024x1024") -> str:
+        image_hash = self.put_bytes(base64.b64decode(b64))
+        if prompt:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO prompts (prompt_key, image_hash) VALUES (?, ?)",
+                    (self._prompt_key(prompt, size), image_hash),
+                )
+        return image_hash
+
+    def lookup_prompt(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT image_hash FROM prompts WHERE prompt_key = ?", (self._prompt_key(prompt, size),)).fetchone()
+        if row is None or self.find(row[0]) is None:
+            return None
+        return row[0]
+
+    def lookup_derived(self, spec_key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT image_hash FROM derivatives WHERE spec_key = ?", (spec_key,)).fetchone()
+        if row is None or self.find(row[0]) is None:
+            return None
+        return row[0]
+
+    def put_derived(self, spec_key: str, data: bytes) -> str:
+        image_hash = self.put_bytes(data)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO derivatives (spec_key, image_hash) VALUES (?, ?)", (spec_key, image_hash))
+        return image_hash
+
+    def find(self, image_hash: str) -> Optional[Tuple[str, str]]:
+        """(path, media type) for a stored image, or None."""
+        if not _HASH.match(image_hash):
+            return None
+        folder = os.path.join(self.root, image_hash[:2])
+        for ext, media_type in (("png", "image/png"), ("svg", "image/svg+xml"), ("jpg", "image/jpeg"), ("webp", "image/webp"), ("bin", "application/octet-stream")):
+            path = os.path.join(folder, f"{image_hash}.{ext}")
+            if os.path.exists(path):
+                return path, media_type
+        return None
+
+
+def image_url(image_hash: str) -> str:
+    return f"/images/{image_hash}"
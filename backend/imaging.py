@@ -0,0 +1,179 @@
+"""Pillow renderers for image derivatives. Runs inside the derivative process pool.
+
+Only stdlib + Pillow are imported here so pool workers start quickly. Every
+function takes and returns plain bytes/str/tuples, which pickle cheaply.
+"""
+import io
+import re
+import textwrap
+import xml.etree.ElementTree as ET
+from typing import List, Optional, Sequence, Tuple
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+RGB = Tuple[int, int, int]
+
+PREVIEW_PX = 384
+MAX_UPLOAD_PX = 4096
+MAX_SVG_PX = 4096
+_FONT_FILES = ("DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf", "LiberationSans-Bold.ttf")
+_LENGTH = re.compile(r"^\s*([\d.]+)\s*(%?)")
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    for name in _FONT_FILES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def _color(value: Optional[str], default: Optional[RGB]) -> Optional[RGB]:
+    try:
+        return ImageColor.getrgb(value.strip())[:3] if value else default
+    except ValueError:
+        return default
+
+
+def _length(value: Optional[str], total: int, default: float = 0.0) -> float:
+    m = _LENGTH.match(value or "")
+    if not m:
+        return default
+    return float(m.group(1)) * total / 100.0 if m.group(2) else float(m.group(1))
+
+
+def rasterize_svg(data: bytes) -> Image.Image:
+    """Rasterize the flat SVGs this app produces itself (mock/placeholder backgrounds: rects and centered text).
+
+    Not a general SVG renderer: gradients, paths and transforms are ignored.
+    Canvases larger than MAX_SVG_PX per side are rejected with ValueError
+    before anything is allocated.
+    """
+    root = ET.fromstring(data)
+    width = int(_length(root.get("width"), 0, 1024)) or 1024
+    height = int(_length(root.get("height"), 0, 1024)) or 1024
+    if max(width, height) > MAX_SVG_PX:
+        raise ValueError(f"SVG canvas {width}x{height} larger than {MAX_SVG_PX}px")
+    image = Image.new("RGBA", (width, height), (255, 255, 255, 255))
+    for el in root.iter():
+        tag = el.tag.rsplit("}", 1)[-1]
+        opacity = float(el.get("opacity", "1"))
+        fill = (_color(el.get("fill"), None) or (0, 0, 0)) + (round(255 * opacity),)
+        layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        if tag == "rect":
+            x, y = _length(el.get("x"), width), _length(el.get("y"), height)
+            w, h = _length(el.get("width"), width, width), _length(el.get("height"), height, height)
+            draw.rectangle((x, y, x + w - 1, y + h - 1), fill=fill)
+        elif tag == "text" and (el.text or "").strip():
+            x, y = _length(el.get("x"), width), _length(el.get("y"), height)
+            anchor = "mm" if el.get("text-anchor") == "middle" else "lm"
+            draw.text((x, y), el.text.strip(), font=_font(int(_length(el.get("font-size"), 0, 16))), fill=fill, anchor=anchor)
+        else:
+            continue
+        image = Image.alpha_composite(image, layer)
+    return image
+
+
+def open_image(data: bytes) -> Image.Image:
+    if b"<svg" in data[:512]:
+        return rasterize_svg(data)
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def _luminance(c: RGB) -> float:
+    return 0.2126 * c[0] + 0.7152 * c[1] + 0.0722 * c[2]
+
+
+def overlay_colors(brand_colors: Sequence[str], background: RGB) -> Tuple[RGB, RGB]:
+    """(band, text) colors from the brand palette: the band is the brand color furthest from the
+    background, the text the palette color (or black/white) with the most contrast on the band."""
+    palette: List[RGB] = []
+    for c in brand_colors:
+        rgb = _color(c, None) if isinstance(c, str) else None  # free-form names ("electric blue") are skipped
+        if rgb is not None and rgb not in palette:
+            palette.append(rgb)
+    if not palette:
+        palette = [(17, 17, 17)]
+    bg = _luminance(background)
+    band = max(palette, key=lambda c: abs(_luminance(c) - bg)) if len(palette) > 1 else palette[0]
+    text = max([c for c in palette if c != band] + [(255, 255, 255), (0, 0, 0)], key=lambda c: abs(_luminance(c) - _luminance(band)))
+    return band, text
+
+
+def composite_overlay(image: Image.Image, text: str, brand_colors: Sequence[str]) -> Image.Image:
+    """Render `text` on a centered brand-colored band, wrapped to at most three lines."""
+    image = image.convert("RGBA")
+    width, height = image.size
+    background = image.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))[:3]
+    band, ink = overlay_colors(brand_colors, background)
+    size = max(12, width // 11)
+    lines = [text]
+    while size > 12:
+        font = _font(size)
+        lines = textwrap.wrap(text, width=max(8, int(width * 0.8 / (size * 0.55))), break_on_hyphens=False) or [""]
+        if len(lines) <= 3 and all(font.getlength(line) <= width * 0.84 for line in lines):
+            break
+        size = int(size * 0.9)
+    font = _font(size)
+    line_h = int(size * 1.25)
+    band_h = line_h * len(lines) + size
+    top = (height - band_h) // 2
+    layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    draw.rectangle((0, top, width, top + band_h), fill=band + (220,))
+    y = top + size // 2 + line_h // 2
+    for line in lines:
+        draw.text((width / 2, y), line, font=font, fill=ink + (255,), anchor="mm")
+        y += line_h
+    return Image.alpha_composite(image, layer)
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    out = io.BytesIO()
+    if fmt == "webp":
+        image.save(out, "WEBP", quality=82, method=4)
+    elif fmt == "png":
+        image.save(out, "PNG", optimize=True)
+    else:
+        raise ValueError(f"unsupported format: {fmt}")
+    return out.getvalue()
+
+
+def render(data: bytes, size: str, fmt: str, overlay: Optional[str] = None, brand_colors: Sequence[str] = ()) -> bytes:
+    """One derivative of a stored image: optionally composited, "preview" (longest side PREVIEW_PX) or "full"."""
+    image = open_image(data)
+    if overlay:
+        image = composite_overlay(image, overlay, brand_colors)
+    if size == "preview":
+        image.thumbnail((PREVIEW_PX, PREVIEW_PX), Image.Resampling.LANCZOS)
+    if fmt == "webp" and image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    return encode(image, fmt)
+
+
+def sanitize_upload(data: bytes) -> bytes:
+    """Re-encode a client-supplied image as PNG, so only pixels Pillow decoded are ever stored and served.
+
+    SVG (script-capable markup) and images larger than MAX_UPLOAD_PX per side are
+    rejected with ValueError; undecodable bytes raise OSError.
+    """
+    if b"<svg" in data[:512].lower():
+        raise ValueError("SVG images are not accepted from clients")
+    image = Image.open(io.BytesIO(data))
+    # Header only so far: refuse oversized images before decoding any pixels
+    if max(image.size) > MAX_UPLOAD_PX:
+        raise ValueError(f"image larger than {MAX_UPLOAD_PX}px")
+    image.load()
+    image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    out = io.BytesIO()
+    image.save(out, "PNG")
+    return out.getvalue()
+
+
+def render_file(path: str, size: str, fmt: str, overlay: Optional[str] = None, brand_colors: Sequence[str] = ()) -> bytes:
+    # Pool entry point: the worker reads the source itself, so only the (small) result crosses processes
+    with open(path, "rb") as f:
+        return render(f.read(), size, fmt, overlay, brand_colors)
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from backend.serialization import dumps_str
+
+logger = logging.getLogger(__name__)
+
+Runner = Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# UPDATE ... RETURNING needs SQLite 3.35+; older libraries claim inside an explicit transaction instead
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+_CLAIMABLE = "status = 'queued' OR (status = 'running' AND COALESCE(lease_until, 0) < ?)"
+
+class JobStore:
+    """SQLite-backed job records so status and results survive a restart.
+
+    The table doubles as the queue shared by every worker process: a job is
+    claimed with a single UPDATE, and a running job holds a lease that its worker
+    renews. A job whose lease ran out (worker killed) is claimable again.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, request TEXT NOT NULL, "
+            "result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        columns = {r[1] for r in self._db.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._db.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created)")
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, request: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, request, created, updated) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(request, ensure_ascii=False), now, now),
+            )
+        return job_id
+
+    def update(self, job_id: str, owner: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> bool:
+        """Record the outcome of a job `owner` ran. False (and nothing written) if the job is no longer
+        ours: its lease expired and another worker reclaimed it, so this result is stale."""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ?, owner = NULL, lease_until = NULL "
+                "WHERE id = ? AND owner = ?",
+                (status, dumps_str(result) if result is not None else None, error, time.time(), job_id, owner),
+            )
+            return cur.rowcount > 0
+
+    def claim(self, owner: str, lease_s: float) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job (or one whose lease expired) for `owner`; None if there is none."""
+        now = time.time()
+        with self._lock:
+            if _HAS_RETURNING:
+                # One statement, so two processes can never claim the same row
+                row = self._db.execute(
+                    f"UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, updated = ? WHERE id = ("
+                    f"SELECT id FROM jobs WHERE {_CLAIMABLE} ORDER BY created LIMIT 1) RETURNING id, kind, request",
+                    (owner, now + lease_s, now, now),
+                ).fetchone()
+            else:
+                row = self._claim_in_transaction(owner, lease_s, now)
+        if row is None:
+            return None
+        return {"id": row[0], "kind": row[1], "request": json.loads(row[2])}
+
+    def _claim_in_transaction(self, owner: str, lease_s: float, now: float) -> Optional[tuple]:
+        # BEGIN IMMEDIATE takes the write lock up front, so the SELECT and UPDATE cannot interleave with another claim
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(f"SELECT id, kind, request FROM jobs WHERE {_CLAIMABLE} ORDER BY created LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, updated = ? WHERE id = ?",
+                    (owner, now + lease_s, now, row[0]),
+                )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return row
+
+    def renew(self, job_id: str, owner: str, lease_s: float) -> bool:
+        """Extend the lease; False if the job is no longer ours (finished, or reclaimed after a stall)."""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time() + lease_s, job_id, owner),
+            )
+        return cur.rowcount == 1
+
+    def release(self, job_id: str, owner: str) -> None:
+        """Hand a running job back to the queue (graceful shutdown mid-job)."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL, updated = ? WHERE id = ? AND owner = ?",
+                (time.time(), job_id, owner),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, request, result, error, created, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "request": json.loads(row[3]),
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+
+class JobQueue:
+    """Bounded pool of asyncio workers draining queued jobs through `runner(kind, request)`.
+
+    Safe to run in several processes against one JobStore: workers claim jobs
+    from SQLite rather than an in-memory queue. A submit wakes this process's
+    workers immediately; jobs submitted elsewhere are found by polling.
+    """
+
+    def __init__(self, store: JobStore, runner: Runner, workers: int = 2, lease_s: float = 30.0, poll_s: float = 1.0):
+        self.store = store
+        self.runner = runner
+        self.n_workers = max(1, workers)
+        self.lease_s = lease_s
+        self.poll_s = poll_s
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        # Jobs interrupted by a restart are claimable again: released ones at once, crashed ones when their lease runs out
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.n_workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, kind: str, request: Dict[str, Any]) -> str:
+        job_id = self.store.create(kind, request)
+        if self._wake is not None:
+            # The Event belongs to the workers' loop; submit() may be called from a threadpool thread
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return job_id
+
+    async def _idle(self) -> None:
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=self.poll_s)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            if not self.store.renew(job_id, self.owner, self.lease_s):
+                return
+
+    async def _worker(self) -> None:
+        while True:
+            job = self.store.claim(self.owner, self.lease_s)
+            if job is None:
+                await self._idle()
+                continue
+            job_id = job["id"]
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                result = await self.runner(job["kind"], job["request"])
+            except asyncio.CancelledError:
+                # Shutdown mid-job: put it back so the next worker (here or in another process) reruns it
+                self.store.release(job_id, self.owner)
+                raise
+            except Exception as e:
+                written = self.store.update(job_id, self.owner, "failed", error=str(e))
+            else:
+                written = self.store.update(job_id, self.owner, "succeeded", result=result)
+            finally:
+                heartbeat.cancel()
+            if not written:
+                logger.warning("job %s was reclaimed by another worker after its lease expired; dropped this result", job_id)
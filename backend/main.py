@@ -1,18 +1,60 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Literal, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from backend.schemas import GenerateRequest, RefineRequest, PostVariant
-from backend.agents import (
-    infer_brand,
-    generate_variants,
-    agentic_self_feedback_loop,
-    attach_background_image,
-    critique_post,
-    revise_post,
-    score_variants,
-    judge_post,
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from backend.schemas import BatchGenerateRequest, GenerateRequest, RefineRequest
+from backend.providers.caching_provider import CachingProvider
+from backend.providers.resilient_provider import CircuitOpenError, ResilientProvider
+from backend.providers.factory import find_layer, shared_provider
+from backend.providers.recording_provider import ReplayProvider
+from backend.providers.routing_provider import MockFallbackProvider, RoutingProvider
+from backend.config import settings
+from backend.context import BudgetExceeded
+from backend.jobs import JobQueue, JobStore
+from backend.metrics import render_prometheus
+from backend.pipeline import run_generate, run_generate_batch, run_refine, variant_store
+from backend.serialization import FastJSONResponse, GZipExceptStreams, dumps_str
+from backend.store import VariantNotFound
+from backend.agents import images, warm_up
+from backend import derivatives
+
+logger = logging.getLogger(__name__)
+
+async def run_job(kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    if kind == "generate":
+        return await run_generate(GenerateRequest(**request))
+    if kind == "refine":
+        return await run_refine(RefineRequest(**request))
+    if kind == "generate_batch":
+        return await run_generate_batch(BatchGenerateRequest(**request))
+    raise ValueError(f"unknown job kind: {kind}")
+
+jobs = JobQueue(
+    JobStore(os.path.join(settings.data_dir, "jobs.sqlite")),
+    run_job,
+    workers=settings.job_workers,
+    lease_s=settings.job_lease_s,
+    poll_s=settings.job_poll_s,
 )
 
-app = FastAPI(title="AI Social Media Agent")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.warmup:
+        # Pay for provider construction and the first upstream connection before taking traffic
+        logger.info("warm-up done: %s", await warm_up())
+    await jobs.start()
+    yield
+    await jobs.stop()
+    derivatives.shutdown()
+
+app = FastAPI(title="AI Social Media Agent", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Negotiated via Accept-Encoding; NDJSON streams are left uncompressed so events are not held back
+app.add_middleware(GZipExceptStreams, minimum_size=1024, skip_paths=("/generate/stream", "/generate/batch"))
 
 # Allow local Streamlit to call FastAPI
 app.add_middleware(
@@ -23,59 +65,194 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(BudgetExceeded)
+async def budget_exceeded(request: Request, exc: BudgetExceeded):
+    # Only required stages (brand inference, drafts, refine's critique/revise) propagate this
+    return JSONResponse(status_code=422, content={"detail": f"{exc}; raise max_calls/max_tokens"})
+
+@app.exception_handler(VariantNotFound)
+async def variant_not_found(request: Request, exc: VariantNotFound):
+    return JSONResponse(status_code=404, content={"detail": f"variant not found: {exc}"})
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open(request: Request, exc: CircuitOpenError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(int(settings.breaker_reset_s))})
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    cache = find_layer(shared_provider(), CachingProvider)
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/provider/stats")
+def provider_stats():
+    # Circuit state and retry/throttle counters for monitoring
+    provider = shared_provider()
+    transport = find_layer(provider, ResilientProvider)
+    routing = find_layer(provider, RoutingProvider)
+    fallback = find_layer(provider, MockFallbackProvider)
+    out: Dict[str, Any] = {"enabled": False} if transport is None else {"enabled": True, **transport.stats()}
+    if routing is not None:
+        out["routing"] = routing.stats()
+    out["mock_fallbacks"] = fallback.fallbacks if fallback is not None else None
+    replayer = find_layer(provider, ReplayProvider)
+    if replayer is not None:
+        out["replay"] = replayer.stats()
+    return out
+
+@app.get("/variants/{variant_id}")
+def get_variant(variant_id: str):
+    record = variant_store.get_variant(variant_id)
+    if record is None:
+        raise VariantNotFound(variant_id)
+    return FastJSONResponse({**dict(record), "lineage": variant_store.lineage(variant_id)})
+
+def _stored_image(image_hash: str, request: Request) -> Response:
+    found = images.find(image_hash)
+    if found is None:
+        raise HTTPException(status_code=404, detail="image not found")
+    path, media_type = found
+    # Content-addressed: the hash is the ETag and the bytes never change
+    headers = {"ETag": f'"{image_hash}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    # Stored SVGs are only ever our own placeholders; still, never let one run script on the API origin
+    headers.update({"X-Content-Type-Options": "nosniff", "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'"})
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@app.get("/images/{image_hash}")
+async def get_image(
+    image_hash: str,
+    request: Request,
+    size: Optional[Literal["preview", "full"]] = None,
+    format: Optional[Literal["webp", "png"]] = None,
+):
+    """The stored image as generated, or with `size`/`format` a rendered derivative (e.g. `?size=preview` for a small WebP)."""
+    if size is None and format is None:
+        return _stored_image(image_hash, request)
+    try:
+        derived = await derivatives.derivative(images, image_hash, size=size or "full", fmt=format or "webp")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"image cannot be rendered: {e}")
+    if derived is None:
+        raise HTTPException(status_code=404, detail="image not found")
+    return _stored_image(derived, request)
+
+@app.get("/variants/{variant_id}/image")
+async def get_variant_image(
+    variant_id: str,
+    request: Request,
+    size: Literal["preview", "full"] = "preview",
+    format: Literal["webp", "png"] = "webp",
+):
+    """The finished post: background with the text overlay rendered in the brand's colors. Small preview unless `size=full`."""
+    record = variant_store.get_variant(variant_id)
+    if record is None:
+        raise VariantNotFound(variant_id)
+    post = record.variant
+    if not post.image_id:
+        raise HTTPException(status_code=404, detail="variant has no image")
+    colors = derivatives.brand_colors(variant_store.get_brand(record.brand_id))
+    try:
+        derived = await derivatives.derivative(images, post.image_id, size=size, fmt=format, overlay=post.text_overlay, colors=colors)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"image cannot be rendered: {e}")
+    if derived is None:
+        raise HTTPException(status_code=404, detail="image not found")
+    return _stored_image(derived, request)
+
 @app.post("/generate")
-def generate(req: GenerateRequest):
-    brand = infer_brand(req.event)
-    variants = generate_variants(req.intent, req.platform, req.event, brand, n_variants=3)
-
-    improved = []
-    for v in variants:
-        v2 = agentic_self_feedback_loop(req.event, req.platform, brand, v, n_iters=2)
-        v2 = attach_background_image(v2)
-        improved.append(v2.model_dump())
-
-    # Judge pass: score and rank variants (fresh rubric, separate call)
-    hydrated = [PostVariant(**v) for v in improved]
-    scored = score_variants(req.event, req.platform, brand, hydrated)
-    scored_sorted = sorted(scored, key=lambda x: (x.judge.overall_score if x.judge else 0), reverse=True)
-
-    return {
-        "brand_profile": brand.model_dump(),
-        "variants": [v.model_dump() for v in scored_sorted],
-    }
+async def generate(req: GenerateRequest):
+    # Returned as a Response so FastAPI does not re-encode the result with jsonable_encoder
+    return FastJSONResponse(await run_generate(req))
+
+def _ndjson(produce: Callable[[Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[None]]) -> StreamingResponse:
+    """Stream whatever `produce(send)` sends as NDJSON lines; the producer is cancelled if the client disconnects."""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run() -> None:
+        try:
+            await produce(queue.put)
+        except Exception as e:
+            await queue.put({"type": "error", "detail": str(e)})
+        finally:
+            await queue.put(None)
+
+    async def lines() -> AsyncIterator[str]:
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield dumps_str(item) + "\n"
+        finally:
+            # Client went away: stop spending model calls on its behalf
+            task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/generate/stream")
+async def generate_stream(req: GenerateRequest):
+    """Same pipeline as /generate, streamed as NDJSON events while stages finish.
+
+    Event order: brand_profile, draft (per variant), critique/revision (per round),
+    image, judge, and finally done with the ranked variant indices.
+    """
+    async def produce(send) -> None:
+        async def sink(kind: str, payload: dict) -> None:
+            await send({"type": kind, **payload})
+        await run_generate(req, on_event=sink)
+
+    return _ndjson(produce)
+
+@app.post("/generate/batch")
+async def generate_batch(req: BatchGenerateRequest):
+    """Campaign batch as NDJSON: one `item` line per request as it finishes (in completion order), then `done`."""
+    async def produce(send) -> None:
+        async def on_item(entry: dict) -> None:
+            await send({"type": "item", **entry})
+        out = await run_generate_batch(req, on_item=on_item)
+        await send({"type": "done", "summary": out["summary"]})
+
+    return _ndjson(produce)
 
 @app.post("/refine")
-def refine(req: RefineRequest):
-    # Re-infer brand from event if the client included it in the selected_post
-    post_obj = req.selected_post
-    event = post_obj.get("event", "Super Bowl")
-    platform = post_obj.get("platform", "LinkedIn")
-
-    brand = infer_brand(event)
-
-    # Build PostVariant from dict
-    v = PostVariant(
-        platform=platform,
-        caption=post_obj["caption"],
-        text_overlay=post_obj["text_overlay"],
-        image_prompt=post_obj["image_prompt"],
-        background_image_b64=post_obj.get("background_image_b64"),
-        critiques=[],
-    )
-
-    # Human-in-the-loop: critique once, then revise using human feedback
-    c = critique_post(platform, event, brand, v)
-    v.critiques.append(c)
-    v = revise_post(event, platform, brand, v, c, human_feedback=req.feedback)
-    v = attach_background_image(v)
-
-    # Re-score refined variant for convenience
-    v.judge = judge_post(platform, event, brand, v)
-
-    out = v.model_dump()
-    out["event"] = event
-    return {"brand_profile": brand.model_dump(), "variant": out}
+async def refine(req: RefineRequest):
+    return FastJSONResponse(await run_refine(req))
+
+@app.post("/jobs/generate")
+async def submit_generate(req: GenerateRequest):
+    return {"job_id": jobs.submit("generate", req.model_dump()), "status": "queued"}
+
+@app.post("/jobs/refine")
+async def submit_refine(req: RefineRequest):
+    return {"job_id": jobs.submit("refine", req.model_dump()), "status": "queued"}
+
+@app.post("/jobs/generate/batch")
+async def submit_generate_batch(req: BatchGenerateRequest):
+    return {"job_id": jobs.submit("generate_batch", req.model_dump()), "status": "queued", "items": len(req.items)}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
+    job = jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    result = job["result"]
+    if result and "items" in result:
+        # Batch results are paged: ?offset=&limit= over the per-item entries
+        items = result["items"]
+        end = len(items) if limit is None else offset + limit
+        job["result"] = {**result, "items": items[offset:end]}
+        job["page"] = {"offset": offset, "limit": limit, "total": len(items), "next_offset": end if end < len(items) else None}
+    return FastJSONResponse(job)
@@ -0,0 +1,188 @@
+"""Lightweight in-process instrumentation: stage spans, provider call metrics, Prometheus text output.
+
+Stages are timed with `traced("critique")` / `span("critique")`. The active stage
+is kept in a ContextVar so provider calls made inside it are labelled with it, and
+each finished span is also appended to the request's RunContext for the optional
+per-request timing breakdown.
+"""
+import bisect
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
+from backend.context import current_run
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+current_stage: ContextVar[str] = ContextVar("current_stage", default="unknown")
+
+LabelKey = Tuple[str, ...]
+
+
+def _fmt_labels(names: Sequence[str], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {v:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values: Dict[LabelKey, Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(counts):
+                counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def mean(self, **labels: str) -> Optional[float]:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            _, total, n = self._values.get(key) or (None, 0.0, 0)
+        return total / n if n else None
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._values.items()):
+                cumulative = 0
+                for le, c in zip(self.buckets, counts):
+                    cumulative += c
+                    labels = _fmt_labels(self.labelnames, key, 'le="%g"' % le)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _fmt_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {n}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {total:g}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class RecentMean:
+    """Mean of the last `size` observations per label value. Unlike Histogram.mean it follows
+    the current latency instead of averaging over the whole process lifetime."""
+
+    def __init__(self, size: int = 50):
+        self.size = size
+        self._values: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label: str) -> None:
+        with self._lock:
+            values = self._values.get(label)
+            if values is None:
+                values = self._values[label] = deque(maxlen=self.size)
+            values.append(value)
+
+    def mean(self, label: str) -> Optional[float]:
+        with self._lock:
+            values = self._values.get(label)
+            return sum(values) / len(values) if values else None
+
+
+STAGE_SECONDS = Histogram("agent_stage_seconds", "Wall time of agent pipeline stages", ["stage"])
+STAGE_ERRORS = Counter("agent_stage_errors_total", "Agent pipeline stages that raised", ["stage"])
+PROVIDER_SECONDS = Histogram("provider_call_seconds", "Latency of provider calls", ["kind", "stage"])
+PROVIDER_CALLS = Counter("provider_calls_total", "Provider calls by outcome", ["kind", "stage", "outcome"])
+PROVIDER_PROMPT_CHARS = Counter("provider_prompt_chars_total", "Characters sent in provider prompts", ["kind", "stage"])
+PROVIDER_RESPONSE_CHARS = Counter("provider_response_chars_total", "Characters received from providers", ["kind", "stage"])
+PROVIDER_TOKENS = Counter("provider_tokens_total", "Token usage reported by the upstream API", ["model", "type"])
+JSON_PARSE_FAILURES = Counter("provider_json_parse_failures_total", "Model responses that were not valid JSON", ["stage"])
+PROVIDER_HEDGES = Counter("provider_hedged_calls_total", "Hedged duplicate provider calls and whether the hedge won", ["backend", "outcome"])
+SINGLEFLIGHT_SHARED = Counter("singleflight_shared_total", "Callers served by an identical in-flight computation", ["scope"])
+# Successful upstream calls only (no cache hits, coalesced followers or cancelled attempts), by stage
+PROVIDER_RECENT_SECONDS = RecentMean()
+
+REGISTRY = [
+    STAGE_SECONDS, STAGE_ERRORS,
+    PROVIDER_SECONDS, PROVIDER_CALLS, PROVIDER_PROMPT_CHARS, PROVIDER_RESPONSE_CHARS,
+    PROVIDER_TOKENS, JSON_PARSE_FAILURES, PROVIDER_HEDGES, SINGLEFLIGHT_SHARED,
+]
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def record_token_usage(model: str, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+    if input_tokens:
+        PROVIDER_TOKENS.inc(input_tokens, model=model, type="input")
+    if output_tokens:
+        PROVIDER_TOKENS.inc(output_tokens, model=model, type="output")
+
+
+@asynccontextmanager
+async def span(stage: str) -> AsyncIterator[None]:
+    token = current_stage.set(stage)
+    run = current_run.get()
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        current_stage.reset(token)
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if run is not None:
+            run.spans.append({"stage": stage, "start_s": start, "duration_s": elapsed, "ok": ok})
+
+
+def traced(stage: str):
+    """Decorator: run an async agent function inside `span(stage)`."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any):
+            async with span(stage):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def timing_breakdown(spans: List[Dict[str, Any]], started: float) -> Dict[str, Any]:
+    """Per-stage count/total/max (ms) for one request, plus its wall time."""
+    stages: Dict[str, Dict[str, float]] = {}
+    for s in spans:
+        agg = stages.setdefault(s["stage"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = s["duration_s"] * 1000
+        agg["count"] += 1
+        agg["total_ms"] += ms
+        agg["max_ms"] = max(agg["max_ms"], ms)
+    for agg in stages.values():
+        agg["total_ms"] = round(agg["total_ms"], 2)
+        agg["max_ms"] = round(agg["max_ms"], 2)
+    return {"wall_ms": round((time.perf_counter() - started) * 1000, 2), "stages": stages}
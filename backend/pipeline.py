@@ -0,0 +1,296 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from backend.config import settings
+from backend.context import BudgetExceeded, RunContext, run_context
+from backend.schemas import BatchGenerateRequest, BrandProfile, GenerateRequest, JudgeResult, RefineRequest, PostVariant
+from backend.diversity import select_diverse
+from backend.singleflight import SingleFlight, request_key
+from backend.metrics import span, timing_breakdown
+from backend.store import VariantNotFound, VariantStore
+from backend.validator import validate_post
+from backend.providers.factory import call_log
+from backend.agents import (
+    ConvergencePolicy,
+    EventSink,
+    infer_brand,
+    generate_variants,
+    improve_variant,
+    score_variants,
+    critique_post,
+    revise_post,
+    judge_post,
+    diff_post,
+    rank_score,
+    fits_deadline,
+    before_deadline,
+    degrade,
+    attach_image_within_deadline,
+    DEGRADE_JUDGE,
+    existing_image,
+    keep_image,
+)
+
+variant_store = VariantStore(
+    max_entries=settings.variant_store_max_entries,
+    max_rows=settings.variant_store_max_rows,
+    ttl_s=settings.variant_store_ttl_s,
+    path=os.path.join(settings.data_dir, "variants.sqlite") if settings.variant_store_persist else None,
+)
+
+def _new_run(req) -> RunContext:
+    run = RunContext(max_calls=req.max_calls, max_tokens=req.max_tokens)
+    if req.deadline_s:
+        run.deadline = run.started + req.deadline_s
+    log = call_log()
+    if log is not None:
+        # Makes the call log a replayable corpus (see benchmarks/replay.py)
+        extra: Dict[str, Any] = {}
+        if isinstance(req, RefineRequest) and req.variant_id:
+            # The stored variant and brand are not in the body; without them the refine cannot be replayed elsewhere
+            record = variant_store.get_variant(req.variant_id)
+            brand = variant_store.get_brand(record.brand_id) if record is not None else None
+            if record is not None:
+                extra["variant"] = record.model_dump(mode="json")
+            if brand is not None:
+                extra["brand"] = brand.model_dump(mode="json")
+        log.request(run.id, "generate" if isinstance(req, GenerateRequest) else "refine", req.model_dump(mode="json"), **extra)
+    return run
+
+# Identical /generate requests in flight (spikes, client retries) run the pipeline once
+generate_flights = SingleFlight("generate")
+
+def _generate_key(req: GenerateRequest, n_variants: int) -> str:
+    body = req.model_dump()
+    body["intent"] = " ".join(req.intent.split())
+    return request_key("generate", body, n_variants)
+
+async def run_generate(
+    req: GenerateRequest,
+    on_event: Optional[EventSink] = None,
+    n_variants: int = 3,
+    brand: Optional[BrandProfile] = None,
+) -> Dict[str, Any]:
+    """Full /generate pipeline. `on_event` receives progress events as each stage finishes.
+
+    Pass `brand` to reuse an already inferred profile (batches share one per event).
+    Without a progress sink, concurrent identical requests are coalesced into one run.
+    """
+    if on_event is None and brand is None and settings.singleflight_enabled:
+        return await generate_flights.do(_generate_key(req, n_variants), lambda: _run_generate(req, None, n_variants, None))
+    return await _run_generate(req, on_event, n_variants, brand)
+
+
+async def _run_generate(
+    req: GenerateRequest, on_event: Optional[EventSink], n_variants: int, brand: Optional[BrandProfile]
+) -> Dict[str, Any]:
+    with run_context(_new_run(req)) as run:
+        return await _generate(req, run, on_event, n_variants, brand)
+
+
+async def _generate(
+    req: GenerateRequest, run: RunContext, on_event: Optional[EventSink], n_variants: int, brand: Optional[BrandProfile]
+) -> Dict[str, Any]:
+    async def emit(kind: str, payload: Dict[str, Any]) -> None:
+        if on_event:
+            await on_event(kind, payload)
+
+    if brand is None:
+        brand = await infer_brand(req.event)
+    await emit("brand_profile", {"brand_profile": brand.model_dump()})
+
+    pool = None
+    if req.candidates and req.candidates > n_variants:
+        # Over-generate cheap text drafts, then only the distinct top ones pay for critiques/images/judging
+        drafts = await generate_variants(req.intent, req.platform, req.event, brand, n_variants=req.candidates)
+        async with span("prune"):
+            selection = select_diverse(drafts, n_variants, brand)
+        variants, pool = selection.kept, selection.to_dict()
+    else:
+        variants = await generate_variants(req.intent, req.platform, req.event, brand, n_variants=n_variants)
+    for i, v in enumerate(variants):
+        await emit("draft", {"index": i, "variant": v.model_dump()})
+
+    def variant_sink(i: int) -> EventSink:
+        async def sink(kind: str, payload: Dict[str, Any]) -> None:
+            await emit(kind, {"index": i, **payload})
+        return sink
+
+    # Each variant's critique loop + image runs concurrently (bounded by MAX_CONCURRENCY)
+    policy = ConvergencePolicy(max_iters=req.max_iters, min_score=req.min_score)
+    improved = await asyncio.gather(*(
+        improve_variant(req.event, req.platform, brand, v, on_event=variant_sink(i) if on_event else None, policy=policy, speculative_image=req.speculative_image)
+        for i, v in enumerate(variants)
+    ))
+
+    # Judge pass: score and rank variants (fresh rubric, separate call)
+    scored = await score_variants(req.event, req.platform, brand, list(improved), on_event=emit if on_event else None, mode=req.judge_mode, gate=req.judge_gate)
+    by_critique = DEGRADE_JUDGE in run.degradations
+    order = sorted(range(len(scored)), key=lambda i: rank_score(scored[i], by_critique), reverse=True)
+    # Keep brand + variants server-side so /refine can take just a variant_id
+    brand_id = variant_store.put_brand(brand)
+    for v in scored:
+        variant_store.put_variant(v, req.event, brand_id)
+
+    usage = {**run.usage(), "iterations": [len(scored[i].critiques) for i in order]}
+    if pool is not None:
+        usage["candidates"] = pool
+    if run.judge_gated:
+        # Positions in the ranked output of the variants the gate kept from the judge
+        usage["judge_gated"] = [pos for pos, i in enumerate(order) if i in run.judge_gated]
+    await emit("done", {"order": order, "usage": usage, "variant_ids": [v.id for v in scored], "brand_profile_id": brand_id})
+
+    # Models stay as-is: the response is serialized once, by serialization.FastJSONResponse
+    out = {
+        "brand_profile": brand,
+        "brand_profile_id": brand_id,
+        "variants": [scored[i] for i in order],
+        "usage": usage,
+    }
+    if req.include_timings:
+        out["timings"] = timing_breakdown(run.spans, run.started)
+    return out
+
+
+async def run_generate_batch(
+    req: BatchGenerateRequest, on_item: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+) -> Dict[str, Any]:
+    """Campaign batch: one brand inference per distinct event, then every item through the shared call pool.
+
+    Items run concurrently (BATCH_CONCURRENCY at a time) and their model calls all queue on the same
+    MAX_CONCURRENCY semaphore, so throughput follows the provider limit rather than the item count.
+    A failing item becomes an error entry; it never fails the batch. `on_item` gets each entry as it finishes.
+    """
+    started = time.perf_counter()
+    events = list(dict.fromkeys(item.event for item in req.items))
+
+    # Brand inference is shared by the batch, so it is charged to its own run, not to any item's budget
+    with run_context(RunContext()) as brand_run:
+        inferred = await asyncio.gather(*(infer_brand(e) for e in events), return_exceptions=True)
+    brands = dict(zip(events, inferred))
+
+    sem = asyncio.Semaphore(max(1, settings.batch_concurrency))
+    results: List[Optional[Dict[str, Any]]] = [None] * len(req.items)
+
+    async def one(i: int, item: GenerateRequest) -> None:
+        brand = brands[item.event]
+        if isinstance(brand, BaseException):
+            entry = {"index": i, "status": "failed", "error": f"brand inference failed: {brand}"}
+        else:
+            async with sem:
+                try:
+                    entry = {"index": i, "status": "succeeded", "result": await run_generate(item, brand=brand)}
+                except Exception as e:
+                    entry = {"index": i, "status": "failed", "error": str(e) or type(e).__name__}
+        results[i] = entry
+        if on_item:
+            await on_item(entry)
+
+    await asyncio.gather(*(one(i, item) for i, item in enumerate(req.items)))
+
+    ok = [r for r in results if r["status"] == "succeeded"]
+    summary = {
+        "items": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "brand_inferences": len(events),
+        "model_calls": brand_run.calls + sum(r["result"]["usage"]["model_calls"] for r in ok),
+        "wall_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    return {"items": results, "summary": summary}
+
+
+async def run_refine(req: RefineRequest) -> Dict[str, Any]:
+    """Human-in-the-loop refinement of one selected variant."""
+    with run_context(_new_run(req)) as run:
+        return await _refine(req, run)
+
+
+async def _refine(req: RefineRequest, run: RunContext) -> Dict[str, Any]:
+    if req.variant_id:
+        # Stored variant: reuse its brand profile instead of re-inferring it
+        record = variant_store.get_variant(req.variant_id)
+        if record is None:
+            raise VariantNotFound(req.variant_id)
+        event, platform = record.event, record.variant.platform
+        brand = variant_store.get_brand(record.brand_id) or await infer_brand(event)
+        v = record.variant.model_copy(update={"critiques": [], "judge": None, "violations": []})
+        prior_judge = record.variant.judge
+        parent_id = record.id
+    else:
+        # Legacy payload: re-infer brand from event if the client included it in the selected_post
+        post_obj = req.selected_post
+        event = post_obj.get("event", "Super Bowl")
+        platform = post_obj.get("platform", "LinkedIn")
+
+        brand = await infer_brand(event)
+
+        # Build PostVariant from dict
+        v = PostVariant(
+            platform=platform,
+            caption=post_obj["caption"],
+            text_overlay=post_obj["text_overlay"],
+            image_prompt=post_obj["image_prompt"],
+            background_image_b64=post_obj.get("background_image_b64"),
+            image_id=post_obj.get("image_id"),
+            image_url=post_obj.get("image_url"),
+            critiques=[],
+        )
+        prior_judge = JudgeResult(**post_obj["judge"]) if post_obj.get("judge") else None
+        # The client-supplied id only links lineage if it names a variant we actually stored
+        claimed = post_obj.get("id")
+        parent_id = claimed if isinstance(claimed, str) and variant_store.get_variant(claimed) is not None else None
+
+    before = v.model_copy()
+    prior_image = await existing_image(v)
+
+    # Human-in-the-loop: critique once, then revise using human feedback
+    c = await critique_post(platform, event, brand, v)
+    v.critiques.append(c)
+    run.critique_rounds += 1
+    v = await revise_post(event, platform, brand, v, c, human_feedback=req.feedback, violations=validate_post(v, brand) or None)
+    v.violations = [x.to_dict() for x in validate_post(v, brand)]
+
+    # Only redo the image/judge when the revision changed what they depend on
+    changes = diff_post(before, v)
+    skipped = []
+    try:
+        if prior_image and changes["image_prompt_kept"]:
+            v = keep_image(v, prior_image)
+            skipped.append("image")
+        else:
+            v = await attach_image_within_deadline(v)
+        if prior_judge is not None and changes["minor_text_edit"] and changes["image_prompt_kept"]:
+            v.judge = prior_judge
+            skipped.append("judge")
+        elif not fits_deadline("judge"):
+            degrade(DEGRADE_JUDGE)
+            skipped.append("judge")
+        else:
+            # Re-score refined variant for convenience
+            v.judge = await before_deadline(judge_post(platform, event, brand, v))
+    except asyncio.TimeoutError:
+        degrade(DEGRADE_JUDGE)
+        skipped.append("judge")
+    except BudgetExceeded:
+        # Image and judge are optional: skipped if the budget has run out
+        skipped.extend(stage for stage in ("image", "judge") if stage not in skipped)
+
+    brand_id = variant_store.put_brand(brand)
+    variant_store.put_variant(v, event, brand_id, parent_id=parent_id, feedback=req.feedback)
+
+    out = v.model_dump()
+    out["event"] = event
+    result = {
+        "brand_profile": brand,
+        "brand_profile_id": brand_id,
+        "variant": out,
+        "lineage": variant_store.lineage(v.id),
+        "changes": changes,
+        "skipped_stages": skipped,
+        "usage": {**run.usage(), "iterations": [1]},
+    }
+    if req.include_timings:
+        result["timings"] = timing_breakdown(run.spans, run.started)
+    return result
@@ -1,128 +1,104 @@
-def brand_inference_prompt(event: str) -> str:
-    return f"""You are a brand strategist + social media designer.
+# Every prompt has the same three-part layout so consecutive calls share a long prefix
+# that the upstream prompt cache can reuse:
+#   1. _PREAMBLE: static instructions, byte-identical for every call of every request
+#   2. _context(): event, platform and compact brand JSON, identical for all ~19 calls of a request
+#   3. the stage's task (static per stage) followed by the per-call payload (post, critique, feedback)
+# Keep per-call values out of parts 1 and 2, and serialize JSON compactly.
+# Providers only cache prefixes of at least 1024 tokens; most prompts here are shorter, so the shared
+# prefix pays off once brand/payload blocks grow (see benchmarks/prompt_tokens.py), not by padding.
+
+_PREAMBLE = """You are the social media team of Hack-Nation, a global AI hackathon.
+House rules: subtle sports metaphors only (no trademarked team names/logos). text_overlay: max 8 words, no emojis.
+image_prompt: abstract sports energy, no faces, no logos, space for a centered overlay.
+LinkedIn: 2–3 short paragraphs max, professional but energetic, CTA at end.
+Instagram: shorter, punchier, line breaks ok, 3–8 hashtags at end, CTA.
+Answer with STRICT JSON only.
+"""
 
-We are building posts for Hack-Nation (a global AI hackathon). Only use the given event context: {event}.
-Infer a practical, approximate brand profile that can be used as JSON constraints for downstream agents.
+_RUBRIC = """Rubric (0-100 each): brand_fit = tone/CTA/language rules; clarity = instantly understandable;
+cta_effectiveness = strong, specific CTA for the platform; visual_readability = short overlay, image leaves space, mobile-friendly.
+overall_score must be a weighted average: 35% brand_fit, 30% clarity, 20% cta_effectiveness, 15% visual_readability.
+"""
 
-Return STRICT JSON with keys:
-- brand_voice: {{tone, emoji_usage, cta_style}}
-- visual_identity: {{colors, style, imagery}}
-- language_rules: {{sentence_length, avoid, must_include}}
+_SCORES = """overall_score, brand_fit, clarity, cta_effectiveness, visual_readability (ints 0-100), rationale (2-4 concrete sentences)"""
 
-Rules:
-- Be concise and actionable, not poetic.
-- Keep colors to 2–4 entries.
-- Keep avoid/must_include to <= 6 items each.
+
+def _context(event: str, platform: str, brand_profile_json: str) -> str:
+    return f"""
+Event: {event}
+Platform: {platform}
+Brand constraints (JSON): {brand_profile_json}
 """
 
 
-def post_generation_prompt(intent: str, platform: str, event: str, brand_profile_json: str, variant_id: int) -> str:
-    return f"""You are a junior social media manager + designer working at machine speed.
+def brand_inference_prompt(event: str) -> str:
+    return f"""{_PREAMBLE}
+Event: {event}
 
-TASK: Create ONE on-brand post variant for Hack-Nation.
+TASK: brand profile. As a brand strategist + designer, infer a practical, approximate brand profile
+that downstream agents can use as JSON constraints. Only use the given event context.
 
-Context:
-- Event reference: {event} (use subtle sports metaphors, avoid trademarked team names/logos)
-- Platform: {platform}
-- Intent: {intent}
+Keys: brand_voice {{tone, emoji_usage, cta_style}}, visual_identity {{colors, style, imagery}},
+language_rules {{sentence_length, avoid, must_include}}.
+Be concise and actionable, not poetic. 2–4 colors; at most 6 avoid/must_include items each.
+"""
 
-Brand constraints (JSON):
-{brand_profile_json}
 
-Output STRICT JSON with keys:
-- caption: string
-- text_overlay: string (max 8 words, no emojis)
-- image_prompt: string (abstract sports energy; no faces; no logos; leave space for centered overlay)
+def post_generation_prompt(intent: str, platform: str, event: str, brand_profile_json: str, variant_id: int) -> str:
+    return f"""{_PREAMBLE}{_context(event, platform, brand_profile_json)}
+TASK: draft ONE on-brand post variant, distinct from the other variants.
 
-Platform norms:
-- LinkedIn: 2–3 short paragraphs max, professional but energetic, CTA at end.
-- Instagram: shorter, punchier, line breaks ok, 3–8 hashtags at end, CTA.
+Keys: caption, text_overlay, image_prompt (strings)
 
-Variant behavior:
-- Make this distinct from other variants (variation #{variant_id}).
+Intent: {intent}
+Variation: #{variant_id}
 """
 
 
 def critique_prompt(platform: str, event: str, brand_profile_json: str, post_json: str) -> str:
-    return f"""You are a strict social media QA reviewer.
-
-Evaluate the post against explicit criteria and suggest ONE concrete improvement.
+    return f"""{_PREAMBLE}{_context(event, platform, brand_profile_json)}
+TASK: act as a strict social media QA reviewer. Evaluate the post against explicit criteria and suggest ONE concrete improvement.
 
-Context:
-- Platform: {platform}
-- Event: {event}
+Keys: brand_consistency, clarity, cta_strength, image_text_readability (integers 1-5), postability ("yes" or "no"),
+improvements (one specific, actionable improvement)
 
-Brand constraints (JSON):
-{brand_profile_json}
-
-Post (JSON):
-{post_json}
-
-Return STRICT JSON with keys:
-- brand_consistency: integer 1-5
-- clarity: integer 1-5
-- cta_strength: integer 1-5
-- image_text_readability: integer 1-5
-- postability: "yes" or "no"
-- improvements: string (one actionable improvement; be specific)
+Post (JSON): {post_json}
 """
 
 
-def revise_prompt(event: str, platform: str, brand_profile_json: str, post_json: str, critique_json: str, human_feedback: str | None) -> str:
-    feedback_block = f"\nHuman feedback: {human_feedback}\n" if human_feedback else ""
-    return f"""You are revising a social media post to improve quality while staying on-brand.
-
-Event: {event}
-Platform: {platform}
-
-Brand constraints (JSON):
-{brand_profile_json}
-
-Current post (JSON):
-{post_json}
+def revise_prompt(event: str, platform: str, brand_profile_json: str, post_json: str, critique_json: str | None, human_feedback: str | None, violations_json: str | None = None) -> str:
+    critique_block = f"Latest critique (JSON): {critique_json}\n" if critique_json else ""
+    violations_block = f"Rule violations to fix (JSON): {violations_json}\n" if violations_json else ""
+    feedback_block = f"Human feedback: {human_feedback}\n" if human_feedback else ""
+    return f"""{_PREAMBLE}{_context(event, platform, brand_profile_json)}
+TASK: revise the post to improve quality while staying on-brand, addressing the notes below.
 
-Latest critique (JSON):
-{critique_json}
-{feedback_block}
+Keys: caption, text_overlay, image_prompt (strings)
 
-Return STRICT JSON with keys:
-- caption: string
-- text_overlay: string (max 8 words, no emojis)
-- image_prompt: string
-"""
+Current post (JSON): {post_json}
+{critique_block}{violations_block}{feedback_block}"""
 
 
 def judge_prompt(platform: str, event: str, brand_profile_json: str, post_json: str) -> str:
-    return f"""You are a senior social media lead reviewing if this is safe to post.
+    return f"""{_PREAMBLE}{_context(event, platform, brand_profile_json)}
+TASK: as a senior social media lead, decide if this post is safe to post. Score it using EXPLICIT criteria. Be harsh but fair.
 
-Score the post using EXPLICIT criteria (0-100). Be harsh but fair.
+{_RUBRIC}
+Keys: {_SCORES}
 
-Context:
-- Platform: {platform}
-- Event: {event}
+Post (JSON): {post_json}
+"""
 
-Brand constraints (JSON):
-{brand_profile_json}
 
-Post (JSON):
-{post_json}
+def judge_batch_prompt(platform: str, event: str, brand_profile_json: str, posts_json: str, n_posts: int) -> str:
+    return f"""{_PREAMBLE}{_context(event, platform, brand_profile_json)}
+TASK: as a senior social media lead, decide which of these posts are safe to post.
+Score EVERY post using the same EXPLICIT criteria, comparing them side by side. Be harsh but fair.
 
-Scoring rubric:
-- brand_fit: matches tone/CTA/language rules (0-100)
-- clarity: message is instantly understandable (0-100)
-- cta_effectiveness: strong, specific CTA for the platform (0-100)
-- visual_readability: overlay is short + image prompt leaves space, mobile-friendly (0-100)
+{_RUBRIC}Scores must reflect the relative ranking: a better post gets a higher overall_score.
 
-overall_score must be a weighted average: 35% brand_fit, 30% clarity, 20% cta_effectiveness, 15% visual_readability.
+Key "results": a list with exactly one object per post, each with keys: index (the post's index), {_SCORES}
 
-Return STRICT JSON with keys:
-- overall_score: int 0-100
-- brand_fit: int 0-100
-- clarity: int 0-100
-- cta_effectiveness: int 0-100
-- visual_readability: int 0-100
-- rationale: string (2-4 sentences, concrete)
+Number of posts: {n_posts}
+Posts (JSON list, each with an "index"): {posts_json}
 """
-
-
- 
\ No newline at end of file
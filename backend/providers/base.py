@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Optional
 
@@ -9,3 +10,17 @@ class AIProvider(ABC):
     @abstractmethod
     def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
         ...
+
+    # Async counterparts. The defaults push the blocking call onto a worker thread;
+    # providers with a native async client should override these.
+    async def agenerate_json(self, prompt: str) -> dict:
+        return await asyncio.to_thread(self.generate_json, prompt)
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        return await asyncio.to_thread(self.generate_image_b64, prompt, size)
+
+    async def awarm_up(self) -> None:
+        """Open connections ahead of the first request. Wrappers forward to the provider they wrap."""
+        inner = getattr(self, "inner", None)
+        if inner is not None:
+            await inner.awarm_up()
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Sequence
+from backend.metrics import current_stage
+from .base import AIProvider
+
+class CachingProvider(AIProvider):
+    """Prompt -> response cache in front of any AIProvider.
+
+    Lookups go to a bounded in-memory LRU first, then to an on-disk SQLite store.
+    Disk entries expire after `ttl_s` and the least recently used rows are evicted
+    once the store grows past `max_bytes`. Values are stored as JSON text so every
+    hit hands out a fresh copy. On the async path disk reads and writes run in a
+    thread so they never block the event loop.
+
+    Calls made during `skip_stages` are passed through uncached: drafting and
+    revision are meant to vary, and a cached draft would make every regenerate of
+    the same request return the same posts until the entry expires.
+    """
+
+    SWEEP_EVERY = 100  # puts between TTL sweeps of the disk store
+
+    def __init__(
+        self,
+        inner: AIProvider,
+        namespace: str,
+        path: Optional[str] = None,
+        max_entries: int = 256,
+        ttl_s: float = 7 * 24 * 3600,
+        max_bytes: int = 512 * 1024 * 1024,
+        skip_stages: Sequence[str] = ("generate_variants", "revise"),
+    ):
+        self.inner = inner
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.skip_stages = frozenset(skip_stages)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._mem: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Separate lock for the disk store, so a thread doing disk I/O never holds up memory lookups on the loop
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self._puts = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache(created)")
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def key(self, kind: str, prompt: str, size: str = "") -> str:
+        raw = json.dumps([self.namespace, kind, prompt, size], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _cacheable(self) -> bool:
+        if current_stage.get() in self.skip_stages:
+            with self._lock:
+                self.skipped += 1
+            return False
+        return True
+
+    def _get_mem(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None and now - hit[0] < self.ttl_s:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            self._mem.pop(key, None)
+            if self._db is None:
+                self.misses += 1
+            return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] < self.ttl_s:
+                self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            if row is not None and now - row[1] < self.ttl_s:
+                self._remember(key, row[1], row[0])
+                self.hits += 1
+                self.disk_hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        hit = self._get_mem(key, now)
+        if hit is not None or self._db is None:
+            return hit
+        return self._get_disk(key, now)
+
+    async def aget(self, key: str) -> Optional[str]:
+        now = time.time()
+        hit = self._get_mem(key, now)
+        if hit is not None or self._db is None:
+            return hit
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    def _put_disk(self, key: str, value: str, now: float) -> None:
+        with self._db_lock:
+            old = self._db.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, len(value)),
+            )
+            self._disk_bytes += len(value) - (old[0] if old else 0)
+            self._puts += 1
+            self._evict(now)
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            self._put_disk(key, value, now)
+
+    async def aput(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_disk, key, value, now)
+
+    def preload(self, keys: Iterable[str]) -> int:
+        """Copy fresh disk entries for `keys` into the in-memory LRU (no hit/miss accounting); returns how many were loaded."""
+        if self._db is None:
+            return 0
+        now = time.time()
+        loaded = 0
+        with self._db_lock, self._lock:
+            for key in keys:
+                row = self._db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] < self.ttl_s:
+                    self._remember(key, row[1], row[0])
+                    loaded += 1
+        return loaded
+
+    def _remember(self, key: str, created: float, value: str) -> None:
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        # Caller holds _db_lock. _disk_bytes is a running total, so most puts cost no scan at all
+        if self._puts % self.SWEEP_EVERY == 0:
+            expired = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache WHERE created < ?", (now - self.ttl_s,)).fetchone()[0]
+            if expired:
+                self._db.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl_s,))
+                self._disk_bytes -= expired
+        if self._disk_bytes <= self.max_bytes:
+            return
+        # Other workers write to the same file: resync before deleting anything
+        total = self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used rows until we are back under the size cap
+        freed = 0
+        doomed = []
+        for k, size in self._db.execute("SELECT key, size FROM cache ORDER BY accessed ASC"):
+            doomed.append((k,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        self._db.executemany("DELETE FROM cache WHERE key = ?", doomed)
+        self._disk_bytes = total - freed
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._mem),
+            }
+
+    def generate_json(self, prompt: str) -> dict:
+        if not self._cacheable():
+            return self.inner.generate_json(prompt)
+        k = self.key("json", prompt)
+        cached = self.get(k)
+        if cached is not None:
+            return json.loads(cached)
+        data = self.inner.generate_json(prompt)
+        self.put(k, json.dumps(data, ensure_ascii=False))
+        return data
+
+    def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        if not self._cacheable():
+            return self.inner.generate_image_b64(prompt, size)
+        k = self.key("image", prompt, size)
+        cached = self.get(k)
+        if cached is not None:
+            return cached
+        b64 = self.inner.generate_image_b64(prompt, size)
+        if b64:
+            self.put(k, b64)
+        return b64
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        if not self._cacheable():
+            return await self.inner.agenerate_json(prompt)
+        k = self.key("json", prompt)
+        cached = await self.aget(k)
+        if cached is not None:
+            return json.loads(cached)
+        data = await self.inner.agenerate_json(prompt)
+        await self.aput(k, json.dumps(data, ensure_ascii=False))
+        return data
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        if not self._cacheable():
+            return await self.inner.agenerate_image_b64(prompt, size)
+        k = self.key("image", prompt, size)
+        cached = await self.aget(k)
+        if cached is not None:
+            return cached
+        b64 = await self.inner.agenerate_image_b64(prompt, size)
+        if b64:
+            await self.aput(k, b64)
+        return b64
@@ -1,9 +1,158 @@
+import os
+import threading
+from typing import Dict, List, Optional
 from backend.config import settings
 from .mock_provider import MockProvider
-from .openai_provider import OpenAIProvider
+from .caching_provider import CachingProvider
+from .instrumented_provider import InstrumentedProvider
+from .resilient_provider import ResilientProvider, SharedTokenBucket
+from .recording_provider import CallLog, RecordingProvider, ReplayProvider
+from .routing_provider import MockFallbackProvider, RoutingProvider, parse_routes
 from .base import AIProvider
 
-def get_provider() -> AIProvider:
+def _simulated(text_latency: str, seed: Optional[int]) -> AIProvider:
+    from .simulated_provider import SimulatedProvider
+
+    return SimulatedProvider(
+        text_latency=text_latency,
+        image_latency=settings.sim_image_latency,
+        error_rate=settings.sim_error_rate,
+        timeout_rate=settings.sim_timeout_rate,
+        timeout_s=settings.openai_timeout_s,
+        seed=seed,
+    )
+
+def _backends() -> Dict[str, AIProvider]:
+    """Named upstream backends: "primary", plus "fast" (a cheaper/faster text model) when configured."""
+    if settings.ai_provider == "openai":
+        # Imported here so mock/simulated workers never load the openai SDK (and start faster)
+        from .openai_provider import OpenAIProvider
+
+        backends: Dict[str, AIProvider] = {"primary": OpenAIProvider()}
+        if settings.openai_fast_text_model:
+            backends["fast"] = OpenAIProvider(text_model=settings.openai_fast_text_model)
+        return backends
+    if settings.ai_provider == "replay":
+        replay = ReplayProvider(
+            settings.replay_path, timing=settings.replay_timing, speed=settings.replay_speed, strict=settings.replay_strict
+        )
+        return {"primary": replay}
+    if settings.ai_provider == "simulated":
+        backends = {"primary": _simulated(settings.sim_text_latency, settings.sim_seed)}
+        if settings.sim_fast_text_latency:
+            seed = settings.sim_seed + 1 if settings.sim_seed is not None else None
+            backends["fast"] = _simulated(settings.sim_fast_text_latency, seed)
+        return backends
+    return {"primary": MockProvider()}
+
+def _routes(backends: Dict[str, AIProvider]) -> Dict[str, List[str]]:
+    if settings.provider_routes:
+        return parse_routes(settings.provider_routes)
+    if "fast" in backends:
+        # Scoring stages are short structured outputs; hedge them on the primary model
+        return {stage: ["fast", "primary"] for stage in ("critique", "judge", "judge_batch")}
+    return {}
+
+def _namespace() -> str:
     if settings.ai_provider == "openai":
-        return OpenAIProvider()
-    return MockProvider()
+        # Stages may be routed to the fast model, so it is part of what a cached response depends on
+        return f"openai:{settings.openai_text_model}:{settings.openai_fast_text_model}:{settings.openai_image_model}:{settings.provider_routes}"
+    if settings.ai_provider == "replay":
+        return f"replay:{settings.replay_path}"
+    return settings.ai_provider
+
+def _shared_bucket() -> Optional[SharedTokenBucket]:
+    # One PROVIDER_RPS budget for all `uvicorn --workers N` processes on this host, not one per process
+    if not settings.shared_rate_limit or settings.provider_rps <= 0:
+        return None
+    path = os.path.join(settings.data_dir, "shared_state.sqlite")
+    return SharedTokenBucket(path, _namespace(), settings.provider_rps, settings.provider_burst)
+
+_call_log: Optional[CallLog] = None
+_call_log_lock = threading.Lock()
+
+def call_log() -> Optional[CallLog]:
+    """The process's call log when RECORD_PATH is set (never while replaying)."""
+    global _call_log
+    if not settings.record_path or settings.ai_provider == "replay":
+        return None
+    if _call_log is None:
+        with _call_log_lock:
+            if _call_log is None:
+                _call_log = CallLog(settings.record_path)
+    return _call_log
+
+def get_provider() -> AIProvider:
+    backends = _backends()
+    log = call_log()
+    if log is not None:
+        # Record right at the upstream: true model latency, one entry per attempt (retries and hedges included)
+        backends = {name: RecordingProvider(b, log, backend=name, record_images=settings.record_images) for name, b in backends.items()}
+    # Metrics see every upstream attempt (including retries and hedges), not cache hits
+    backends = {name: InstrumentedProvider(b) for name, b in backends.items()}
+    routing = RoutingProvider(
+        backends,
+        routes=_routes(backends),
+        hedge_percentile=settings.hedge_percentile,
+        hedge_min_s=settings.hedge_min_s,
+        hedge_min_samples=settings.hedge_min_samples,
+        hedge_max_ratio=settings.hedge_max_ratio,
+    )
+    provider: AIProvider = routing
+    if settings.resilience_enabled:
+        provider = ResilientProvider(
+            routing,
+            rate_per_s=settings.provider_rps,
+            burst=settings.provider_burst,
+            max_inflight=settings.provider_max_inflight,
+            max_retries=settings.provider_max_retries,
+            backoff_s=settings.provider_backoff_s,
+            backoff_max_s=settings.provider_backoff_max_s,
+            breaker_failures=settings.breaker_failures,
+            breaker_reset_s=settings.breaker_reset_s,
+            bucket=_shared_bucket(),
+        )
+        # Hedges start below this layer; route them back through its rate limit, in-flight cap and breaker
+        routing.admit_hedge = provider.admit_hedge
+    # Cache sits outside the transport layer so hits never wait on the rate limiter. Off while recording:
+    # hits never reach RecordingProvider, so the log would be missing calls a replay (cache off) makes
+    if settings.cache_enabled and log is None:
+        provider = CachingProvider(
+            provider,
+            namespace=_namespace(),
+            path=os.path.join(settings.data_dir, "provider_cache.sqlite"),
+            max_entries=settings.cache_max_entries,
+            ttl_s=settings.cache_ttl_s,
+            max_bytes=settings.cache_max_mb * 1024 * 1024,
+            skip_stages=[s.strip() for s in settings.cache_skip_stages.split(",") if s.strip()],
+        )
+    # Outermost and opt-in: mock output is never cached and never served unless asked for
+    if settings.mock_fallback and settings.ai_provider != "mock":
+        provider = MockFallbackProvider(provider)
+    return provider
+
+_shared: Optional[AIProvider] = None
+_shared_lock = threading.Lock()
+
+def shared_provider() -> AIProvider:
+    """The process-wide provider chain, built on first use rather than at import time."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = get_provider()
+    return _shared
+
+def set_shared_provider(provider: AIProvider) -> None:
+    """Replace the process-wide chain (benchmarks wrap it to record prompts)."""
+    global _shared
+    with _shared_lock:
+        _shared = provider
+
+def find_layer(provider: AIProvider, cls: type) -> Optional[AIProvider]:
+    """Walk a chain of wrapping providers (via `.inner`) and return the first instance of `cls`."""
+    while provider is not None:
+        if isinstance(provider, cls):
+            return provider
+        provider = getattr(provider, "inner", None)
+    return None
@@ -0,0 +1,72 @@
+import json
+import time
+from typing import Any, Awaitable, Callable, Optional
+from backend.context import mark_upstream_call
+from backend.metrics import (
+    JSON_PARSE_FAILURES,
+    PROVIDER_CALLS,
+    PROVIDER_PROMPT_CHARS,
+    PROVIDER_RECENT_SECONDS,
+    PROVIDER_RESPONSE_CHARS,
+    PROVIDER_SECONDS,
+    current_stage,
+)
+from .base import AIProvider
+
+
+class InstrumentedProvider(AIProvider):
+    """Records latency, outcome and prompt/response size of every upstream call, labelled by pipeline stage."""
+
+    def __init__(self, inner: AIProvider):
+        self.inner = inner
+
+    def _record(self, kind: str, prompt: str, start: float, result: Any, error: Optional[BaseException]) -> None:
+        stage = current_stage.get()
+        elapsed = time.perf_counter() - start
+        PROVIDER_SECONDS.observe(elapsed, kind=kind, stage=stage)
+        PROVIDER_PROMPT_CHARS.inc(len(prompt), kind=kind, stage=stage)
+        if error is None:
+            PROVIDER_RECENT_SECONDS.observe(elapsed, stage)
+            PROVIDER_CALLS.inc(kind=kind, stage=stage, outcome="ok")
+            size = len(result) if isinstance(result, str) else len(json.dumps(result, ensure_ascii=False)) if result is not None else 0
+            PROVIDER_RESPONSE_CHARS.inc(size, kind=kind, stage=stage)
+        elif isinstance(error, json.JSONDecodeError):
+            PROVIDER_CALLS.inc(kind=kind, stage=stage, outcome="parse_error")
+            JSON_PARSE_FAILURES.inc(stage=stage)
+        else:
+            PROVIDER_CALLS.inc(kind=kind, stage=stage, outcome="error")
+
+    def _call(self, kind: str, prompt: str, fn: Callable[[], Any]) -> Any:
+        mark_upstream_call()
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            self._record(kind, prompt, start, None, e)
+            raise
+        self._record(kind, prompt, start, result, None)
+        return result
+
+    async def _acall(self, kind: str, prompt: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # The run is charged for this call (cache hits and coalesced followers never get here)
+        mark_upstream_call()
+        start = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as e:
+            self._record(kind, prompt, start, None, e)
+            raise
+        self._record(kind, prompt, start, result, None)
+        return result
+
+    def generate_json(self, prompt: str) -> dict:
+        return self._call("json", prompt, lambda: self.inner.generate_json(prompt))
+
+    def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        return self._call("image", prompt, lambda: self.inner.generate_image_b64(prompt, size))
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        return await self._acall("json", prompt, lambda: self.inner.agenerate_json(prompt))
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        return await self._acall("image", prompt, lambda: self.inner.agenerate_image_b64(prompt, size))
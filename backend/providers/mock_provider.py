@@ -1,5 +1,6 @@
 import base64
 import json
+import re
 from typing import Optional
 from .base import AIProvider
 
@@ -34,6 +35,23 @@ class MockProvider(AIProvider):
                 "postability": "yes",
                 "improvements": "Make the CTA more specific (e.g., add a deadline or link instruction)."
             }
+        if "score every post" in p:
+            m = re.search(r"number of posts: (\d+)", p)
+            n = int(m.group(1)) if m else 1
+            return {
+                "results": [
+                    {
+                        "index": i,
+                        "overall_score": 84 - i,
+                        "brand_fit": 86,
+                        "clarity": 82,
+                        "cta_effectiveness": 78 - i,
+                        "visual_readability": 90,
+                        "rationale": "On-brand and clear, but the CTA could be more specific (deadline/link). Overlay length looks safe for mobile."
+                    }
+                    for i in range(n)
+                ]
+            }
         if "overall_score" in p and "weighted average" in p:
             return {
                 "overall_score": 84,
@@ -57,3 +75,9 @@ Bring your best idea, ship a demo, and join builders worldwide.
     def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
         svg = _svg_placeholder("Hack-Nation")
         return base64.b64encode(svg.encode("utf-8")).decode("utf-8")
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        return self.generate_json(prompt)
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        return self.generate_image_b64(prompt, size)
@@ -1,14 +1,23 @@
 import json
 import os
 import base64
+import logging
 from typing import Optional
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from .base import AIProvider
 from backend.config import settings
+from backend.metrics import record_token_usage
+
+logger = logging.getLogger(__name__)
 
 class OpenAIProvider(AIProvider):
-    def __init__(self):
-        self.client = OpenAI(timeout=settings.openai_timeout_s)
+    def __init__(self, text_model: Optional[str] = None, image_model: Optional[str] = None):
+        self.text_model = text_model or settings.openai_text_model
+        self.image_model = image_model or settings.openai_image_model
+        # ResilientProvider owns retries when enabled; don't multiply them with the SDK's own
+        max_retries = 0 if settings.resilience_enabled else 2
+        self.client = OpenAI(timeout=settings.openai_timeout_s, max_retries=max_retries)
+        self.aclient = AsyncOpenAI(timeout=settings.openai_timeout_s, max_retries=max_retries)
 
     def _extract_json(self, text: str) -> dict:
         # Try strict JSON parse first; then recover if model wrapped it.
@@ -23,18 +32,47 @@ class OpenAIProvider(AIProvider):
                 return json.loads(text[start:end+1])
             raise
 
+    def _record_usage(self, resp) -> None:
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            record_token_usage(self.text_model, getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None))
+
     def generate_json(self, prompt: str) -> dict:
         # Use Responses API (recommended for new projects)
         resp = self.client.responses.create(
-            model=settings.openai_text_model,
+            model=self.text_model,
             input=prompt,
         )
+        self._record_usage(resp)
         return self._extract_json(resp.output_text)
 
     def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
         # Use Images API for a single-shot generation (returns base64)
         result = self.client.images.generate(
-            model=settings.openai_image_model,
+            model=self.image_model,
+            prompt=prompt,
+            size=size
+        )
+        return result.data[0].b64_json
+
+    async def awarm_up(self) -> None:
+        # A cheap authenticated GET opens the pooled TLS connection the first real call would otherwise pay for
+        try:
+            await self.aclient.models.retrieve(self.text_model)
+        except Exception as e:
+            logger.warning("openai warm-up failed (first call will connect): %s", e)
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        resp = await self.aclient.responses.create(
+            model=self.text_model,
+            input=prompt,
+        )
+        self._record_usage(resp)
+        return self._extract_json(resp.output_text)
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        result = await self.aclient.images.generate(
+            model=self.image_model,
             prompt=prompt,
             size=size
         )
@@ -0,0 +1,283 @@
+"""Record real provider traffic and replay it offline.
+
+`RecordingProvider` wraps one upstream backend and appends every call (prompt,
+response, error or cancellation, latency, model, pipeline stage, run id) to a
+JSONL call log.
+The pipeline adds one `request` line per run with the request body (and, for a
+refine by `variant_id`, the stored variant and brand it resolved to), so a log
+is a self-contained corpus that `benchmarks/replay.py` can re-run.
+
+`ReplayProvider` serves the recorded responses instead of calling anything,
+optionally sleeping the recorded latency, so full pipelines run deterministically
+without network or API spend.
+"""
+import asyncio
+import base64
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from backend.context import current_run
+from backend.metrics import current_stage
+from .base import AIProvider
+from .mock_provider import MockProvider
+from .resilient_provider import is_retryable
+
+LOG_VERSION = 1
+
+
+def _sha(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _run_id() -> Optional[str]:
+    run = current_run.get()
+    return run.id if run is not None else None
+
+
+class CallLog:
+    """Append-only JSONL file. Each entry is written with a single O_APPEND write, so
+    several threads (or uvicorn workers) can share one log without interleaving lines."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps({"v": LOG_VERSION, "ts": round(time.time(), 3), **entry}, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            os.write(self._fd, (line + "\n").encode("utf-8"))
+
+    def request(self, run_id: str, kind: str, body: Dict[str, Any], **extra: Any) -> None:
+        self.write({"type": "request", "run": run_id, "kind": kind, "body": body, **extra})
+
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Entries of a call log; a truncated last line (process killed mid-write) is skipped."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+class RecordingProvider(AIProvider):
+    """Passes calls through to `inner` and logs each one. Image bytes are only kept with `record_images`."""
+
+    def __init__(self, inner: AIProvider, log: CallLog, backend: str = "primary", record_images: bool = False):
+        self.inner = inner
+        self.log = log
+        self.backend = backend
+        self.record_images = record_images
+
+    def _record(self, kind: str, prompt: str, size: Optional[str], start: float, result: Any, error: Optional[BaseException]) -> None:
+        model = getattr(self.inner, "text_model" if kind == "json" else "image_model", None) or type(self.inner).__name__
+        entry: Dict[str, Any] = {
+            "type": "call",
+            "run": _run_id(),
+            "backend": self.backend,
+            "model": model,
+            "kind": kind,
+            "stage": current_stage.get(),
+            "prompt": prompt,
+            "latency_s": round(time.perf_counter() - start, 4),
+        }
+        if size is not None:
+            entry["size"] = size
+        if isinstance(error, asyncio.CancelledError):
+            # Hedge loser or deadline: the upstream was called (and may bill) but no response was used
+            entry["cancelled"] = True
+        elif error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"
+            entry["retryable"] = is_retryable(error)
+        elif kind == "image" and not self.record_images:
+            entry["response"] = None
+            entry["image_sha256"] = hashlib.sha256(base64.b64decode(result)).hexdigest() if result else None
+        else:
+            entry["response"] = result
+        self.log.write(entry)
+
+    def generate_json(self, prompt: str) -> dict:
+        start = time.perf_counter()
+        try:
+            result = self.inner.generate_json(prompt)
+        except Exception as e:
+            self._record("json", prompt, None, start, None, e)
+            raise
+        self._record("json", prompt, None, start, result, None)
+        return result
+
+    def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        start = time.perf_counter()
+        try:
+            result = self.inner.generate_image_b64(prompt, size)
+        except Exception as e:
+            self._record("image", prompt, size, start, None, e)
+            raise
+        self._record("image", prompt, size, start, result, None)
+        return result
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        start = time.perf_counter()
+        try:
+            result = await self.inner.agenerate_json(prompt)
+        except (Exception, asyncio.CancelledError) as e:
+            self._record("json", prompt, None, start, None, e)
+            raise
+        self._record("json", prompt, None, start, result, None)
+        return result
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        start = time.perf_counter()
+        try:
+            result = await self.inner.agenerate_image_b64(prompt, size)
+        except (Exception, asyncio.CancelledError) as e:
+            self._record("image", prompt, size, start, None, e)
+            raise
+        self._record("image", prompt, size, start, result, None)
+        return result
+
+
+class ReplayMiss(LookupError):
+    """No recorded response matches the prompt (strict replay only)."""
+
+
+class ReplayedProviderError(RuntimeError):
+    """A recorded upstream failure, raised again on replay. Retryable failures carry a 503 so retries replay too."""
+
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.status_code = 503 if retryable else 400
+
+
+class ReplayProvider(AIProvider):
+    """Serves responses from a call log, matched by exact prompt.
+
+    A prompt recorded several times (retries, repeated requests) replays its
+    entries in log order, then keeps returning the last successful one. A prompt
+    that was never recorded (the pipeline under test changed it) falls back to
+    the most similar recorded prompt of the same stage when one is at least
+    `min_similarity` alike, else to MockProvider output, or raises ReplayMiss
+    when `strict`. `timing="recorded"` sleeps each call's recorded latency times `speed`.
+    Cancelled calls (hedge losers) carry no response and are not replayed.
+    """
+
+    def __init__(self, path: str, timing: str = "none", speed: float = 1.0, strict: bool = False, min_similarity: float = 0.5):
+        self.path = path
+        self.timing = timing
+        self.speed = speed
+        self.strict = strict
+        self.min_similarity = min_similarity
+        self.mock = MockProvider()
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.calls_by_stage: Dict[str, int] = {}
+        self._entries: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._cursor: Dict[Tuple[str, str], int] = {}
+        self._by_stage: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        self._signatures: Dict[Tuple[str, str], Tuple[int, ...]] = {}
+        self._lock = threading.Lock()
+        for entry in read_log(path):
+            if entry.get("type") != "call" or entry.get("cancelled"):
+                continue
+            key = (entry["kind"], _sha(entry["prompt"]))
+            if key not in self._entries:
+                self._by_stage.setdefault((entry["kind"], entry.get("stage", "")), []).append((key[1], entry["prompt"]))
+            self._entries.setdefault(key, []).append(entry)
+
+    def _signature(self, prompt: str) -> Tuple[int, ...]:
+        from backend.diversity import minhash, shingles
+
+        # Every prompt shares the static preamble; compare the task and payload only
+        return minhash(shingles(prompt[prompt.find("TASK:"):]))
+
+    def _nearest(self, kind: str, prompt: str) -> Optional[Tuple[str, str]]:
+        from backend.diversity import similarity
+
+        candidates = self._by_stage.get((kind, current_stage.get()), [])
+        if not candidates:
+            return None
+        sig = self._signature(prompt)
+        best, best_sim = None, 0.0
+        for digest, recorded in candidates:
+            key = (kind, digest)
+            if key not in self._signatures:
+                self._signatures[key] = self._signature(recorded)
+            sim = similarity(sig, self._signatures[key])
+            if sim > best_sim:
+                best, best_sim = key, sim
+        return best if best_sim >= self.min_similarity else None
+
+    def _lookup(self, kind: str, prompt: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stage = current_stage.get()
+            self.calls_by_stage[stage] = self.calls_by_stage.get(stage, 0) + 1
+            key: Optional[Tuple[str, str]] = (kind, _sha(prompt))
+            if key in self._entries:
+                self.hits += 1
+            else:
+                key = self._nearest(kind, prompt)
+                if key is None:
+                    self.misses += 1
+                    if self.strict:
+                        raise ReplayMiss(f"no recorded {kind} response for stage {stage!r}")
+                    return None
+                self.fuzzy_hits += 1
+            seq = self._entries[key]
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            if i < len(seq):
+                return seq[i]
+            ok = [e for e in seq if "error" not in e]
+            return ok[-1] if ok else seq[-1]
+
+    def _delay(self, entry: Optional[Dict[str, Any]]) -> float:
+        if entry is None or self.timing != "recorded":
+            return 0.0
+        return entry.get("latency_s", 0.0) * self.speed
+
+    def _result(self, kind: str, prompt: str, size: str, entry: Optional[Dict[str, Any]]) -> Any:
+        if entry is None:
+            return self.mock.generate_json(prompt) if kind == "json" else self.mock.generate_image_b64(prompt, size)
+        if "error" in entry:
+            raise ReplayedProviderError(entry["error"], entry.get("retryable", False))
+        if kind == "image" and entry.get("response") is None:
+            # Image bytes were not recorded: keep the call (and its timing) but serve a placeholder
+            return self.mock.generate_image_b64(prompt, size)
+        return copy.deepcopy(entry["response"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "calls_by_stage": dict(self.calls_by_stage),
+            }
+
+    def generate_json(self, prompt: str) -> dict:
+        entry = self._lookup("json", prompt)
+        time.sleep(self._delay(entry))
+        return self._result("json", prompt, "", entry)
+
+    def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        entry = self._lookup("image", prompt)
+        time.sleep(self._delay(entry))
+        return self._result("image", prompt, size, entry)
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        entry = self._lookup("json", prompt)
+        await asyncio.sleep(self._delay(entry))
+        return self._result("json", prompt, "", entry)
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        entry = self._lookup("image", prompt)
+        await asyncio.sleep(self._delay(entry))
+        return self._result("image", prompt, size, entry)
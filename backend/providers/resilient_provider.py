@@ -0,0 +1,316 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+from .base import AIProvider
+
+T = TypeVar("T")
+
+# Matched by name so this module does not have to import the openai SDK
+_RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError"}
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream provider is failing; calls are rejected until the breaker resets."""
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, (json.JSONDecodeError, TimeoutError, ConnectionError)):
+        return True
+    if getattr(e, "status_code", None) in _RETRYABLE_STATUS:
+        return True
+    return any(c.__name__ in _RETRYABLE_ERRORS for c in type(e).__mro__)
+
+
+class TokenBucket:
+    """Rate limiter shared by every caller of one provider (threads and event loops alike).
+
+    Callers reserve a token and get back how long to wait before using it, so the
+    same bucket serves the sync and async paths.
+    """
+
+    def __init__(self, rate_per_s: float, burst: int):
+        self.rate = rate_per_s
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def areserve(self) -> float:
+        return self.reserve()
+
+
+class SharedTokenBucket:
+    """TokenBucket kept in a SQLite row, so every worker process on the host draws from one bucket.
+
+    Same `reserve()` contract as TokenBucket. Each reservation is one short
+    BEGIN IMMEDIATE transaction; wall-clock time is used since monotonic clocks
+    are not comparable across processes. A transaction can wait on another
+    process's lock (up to the 10 s busy timeout), so `areserve()` runs it in a
+    thread rather than on the event loop. Only SELECT and INSERT OR REPLACE are
+    used (no RETURNING), so any SQLite 3 works.
+    """
+
+    def __init__(self, path: str, name: str, rate_per_s: float, burst: int):
+        self.rate = rate_per_s
+        self.capacity = max(1, burst)
+        self.name = name
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+                now = time.time()
+                tokens = float(self.capacity) if row is None else min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+                tokens -= 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)", (self.name, tokens, now)
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    async def areserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        return await asyncio.to_thread(self.reserve)
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures; half_open after `reset_s` lets one trial call through."""
+
+    def __init__(self, failure_threshold: int = 5, reset_s: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """Admit a call or raise CircuitOpenError. True if the admitted call is the half-open trial."""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_s:
+                    raise CircuitOpenError("provider circuit is open; failing fast")
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    raise CircuitOpenError("provider circuit is half-open; trial call in flight")
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def abandon_trial(self) -> None:
+        """The trial call was cancelled before it produced a verdict: neither success nor failure, just free the slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class ResilientProvider(AIProvider):
+    """Transport middleware: rate limit, in-flight cap, jittered retries, circuit breaker."""
+
+    def __init__(
+        self,
+        inner: AIProvider,
+        rate_per_s: float = 0.0,
+        burst: int = 10,
+        max_inflight: int = 16,
+        max_retries: int = 3,
+        backoff_s: float = 0.5,
+        backoff_max_s: float = 8.0,
+        breaker_failures: int = 5,
+        breaker_reset_s: float = 30.0,
+        bucket: Optional[Union[TokenBucket, SharedTokenBucket]] = None,
+    ):
+        self.inner = inner
+        # The breaker and in-flight cap stay per process; only the rate limit can be shared
+        self.bucket = bucket if bucket is not None else TokenBucket(rate_per_s, burst)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_s)
+        self.max_inflight = max(1, max_inflight)
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.backoff_max_s = backoff_max_s
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.throttled_s = 0.0
+        self._sync_inflight = threading.BoundedSemaphore(self.max_inflight)
+        self._async_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    def _inflight(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._async_inflight.get(loop)
+        if sem is None:
+            sem = self._async_inflight[loop] = asyncio.Semaphore(self.max_inflight)
+        return sem
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform in [0, min(cap, base * 2^attempt)] so retries from concurrent requests spread out
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_s * (2 ** attempt)))
+
+    def _admit(self) -> bool:
+        try:
+            trial = self.breaker.before_call()
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+        self.calls += 1
+        return trial
+
+    def _failed(self, e: Exception, attempt: int) -> bool:
+        """Record a failed attempt; True if it should be retried."""
+        if not is_retryable(e):
+            # Caller error (bad request etc.): not a sign the upstream is degraded
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        if attempt >= self.max_retries or self.breaker.state == "open":
+            self.failures += 1
+            return False
+        self.retries += 1
+        return True
+
+    def _call(self, fn: Callable[[], T]) -> T:
+        attempt = 0
+        while True:
+            trial = self._admit()
+            try:
+                wait = self.bucket.reserve()
+                if wait:
+                    self.throttled_s += wait
+                    time.sleep(wait)
+                with self._sync_inflight:
+                    result = fn()
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                if trial:
+                    self.breaker.abandon_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def _acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            trial = self._admit()
+            try:
+                wait = await self.bucket.areserve()
+                if wait:
+                    self.throttled_s += wait
+                    await asyncio.sleep(wait)
+                async with self._inflight():
+                    result = await fn()
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (deadline, client disconnect, hedge loser): says nothing about the upstream
+                if trial:
+                    self.breaker.abandon_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def admit_hedge(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run one extra attempt started below this layer (a RoutingProvider hedge) under the same limits.
+
+        The hedge takes a rate-limit token and an in-flight slot like any call and
+        its outcome feeds the breaker. It is never retried, and it is refused with
+        CircuitOpenError unless the breaker is closed: a degraded upstream gets no
+        duplicate load and the half-open trial stays the only call.
+        """
+        if self.breaker.state != "closed":
+            raise CircuitOpenError("provider circuit is not closed; not hedging")
+        self.hedges += 1
+        wait = await self.bucket.areserve()
+        if wait:
+            self.throttled_s += wait
+            await asyncio.sleep(wait)
+        async with self._inflight():
+            try:
+                result = await fn()
+            except Exception as e:
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                raise
+        self.breaker.record_success()
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "throttled_s": round(self.throttled_s, 3),
+        }
+
+    def generate_json(self, prompt: str) -> dict:
+        return self._call(lambda: self.inner.generate_json(prompt))
+
+    def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        return self._call(lambda: self.inner.generate_image_b64(prompt, size))
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        return await self._acall(lambda: self.inner.agenerate_json(prompt))
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        return await self._acall(lambda: self.inner.agenerate_image_b64(prompt, size))
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+from backend.metrics import PROVIDER_HEDGES, current_stage
+from .base import AIProvider
+from .mock_provider import MockProvider
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+def parse_routes(spec: str) -> Dict[str, List[str]]:
+    """"critique=fast|primary,judge=fast" -> {stage: [backend, hedge backend, ...]}."""
+    routes: Dict[str, List[str]] = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        stage, backends = part.split("=", 1)
+        names = [b.strip() for b in backends.split("|") if b.strip()]
+        if stage.strip() and names:
+            routes[stage.strip()] = names
+    return routes
+
+
+class LatencyWindow:
+    """Latencies of the last `size` successful calls, for percentile-based hedge thresholds."""
+
+    def __init__(self, size: int = 200):
+        self._values: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+class RoutingProvider(AIProvider):
+    """Routes each call to a backend by pipeline stage and hedges slow calls.
+
+    `routes` maps a stage label (see metrics.current_stage) to backend names; the
+    first one serves the call and, once the call has been running longer than the
+    backend's `hedge_percentile` latency, a duplicate goes to the second name (or
+    the same backend again). Whichever returns a valid result first wins and the
+    other is cancelled. Hedges are capped at `hedge_max_ratio` of calls so a
+    slow upstream is not hit with twice the load, and only calls of `hedge_kinds`
+    are hedged (not images: a duplicate image costs as much as the original).
+
+    This layer sits below ResilientProvider, so a hedge would bypass the rate
+    limit, in-flight cap and breaker; `admit_hedge` (set to
+    ResilientProvider.admit_hedge by the factory) runs each hedge under them.
+    """
+
+    def __init__(
+        self,
+        backends: Dict[str, AIProvider],
+        routes: Optional[Dict[str, List[str]]] = None,
+        default: str = "primary",
+        hedge_percentile: float = 95.0,
+        hedge_min_s: float = 0.5,
+        hedge_min_samples: int = 20,
+        hedge_max_ratio: float = 0.1,
+        hedge_kinds: Tuple[str, ...] = ("json",),
+        admit_hedge: Optional[Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]] = None,
+    ):
+        if default not in backends:
+            raise ValueError(f"default backend {default!r} is not configured")
+        self.backends = backends
+        self.default = default
+        self.routes = {stage: [n for n in names if n in backends] or [default] for stage, names in (routes or {}).items()}
+        self.inner = backends[default]  # for find_layer()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_s = hedge_min_s
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_ratio = hedge_max_ratio
+        self.hedge_kinds = hedge_kinds
+        self.admit_hedge = admit_hedge
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latency: Dict[Tuple[str, str], LatencyWindow] = {}
+        self._calls_by_backend: Dict[str, int] = {name: 0 for name in backends}
+
+    def _route(self) -> List[str]:
+        return self.routes.get(current_stage.get(), [self.default])
+
+    def _window(self, backend: str, kind: str) -> LatencyWindow:
+        key = (backend, kind)
+        window = self._latency.get(key)
+        if window is None:
+            window = self._latency[key] = LatencyWindow()
+        return window
+
+    def hedge_after(self, backend: str, kind: str) -> Optional[float]:
+        """Seconds after which a call to `backend` gets hedged (None: not enough samples yet, or disabled)."""
+        if self.hedge_percentile <= 0 or kind not in self.hedge_kinds:
+            return None
+        window = self._window(backend, kind)
+        if len(window) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_s, window.percentile(self.hedge_percentile) or 0.0)
+
+    def _may_hedge(self) -> bool:
+        return self.hedged < self.hedge_max_ratio * self.calls
+
+    async def _timed(self, backend: str, kind: str, call: Callable[[AIProvider], Awaitable[T]]) -> T:
+        self._calls_by_backend[backend] += 1
+        start = time.perf_counter()
+        result = await call(self.backends[backend])
+        self._window(backend, kind).add(time.perf_counter() - start)
+        return result
+
+    async def _race(self, kind: str, call: Callable[[AIProvider], Awaitable[T]]) -> T:
+        route = self._route()
+        primary, alternate = route[0], route[1] if len(route) > 1 else route[0]
+        self.calls += 1
+        tasks: Dict["asyncio.Future[T]", str] = {asyncio.ensure_future(self._timed(primary, kind, call)): primary}
+        hedge_after = self.hedge_after(primary, kind)
+        hedge: Optional["asyncio.Future[T]"] = None
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                timeout = hedge_after if hedge is None and error is None else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_after = None
+                    if self._may_hedge():
+                        self.hedged += 1
+                        attempt = lambda: self._timed(alternate, kind, call)  # noqa: E731
+                        hedge = asyncio.ensure_future(self.admit_hedge(attempt) if self.admit_hedge is not None else attempt())
+                        tasks[hedge] = alternate
+                    continue
+                for task in done:
+                    backend = tasks.pop(task)
+                    if task.exception() is None:
+                        if hedge is not None:
+                            won = task is hedge
+                            self.hedge_wins += won
+                            PROVIDER_HEDGES.inc(backend=alternate, outcome="won" if won else "lost")
+                        return task.result()
+                    # Invalid JSON / upstream error: the other request may still succeed
+                    error = task.exception()
+                    logger.debug("routed %s call to %s failed: %s", kind, backend, error)
+            assert error is not None
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        latency = {}
+        for (backend, kind), window in sorted(self._latency.items()):
+            p50, p95 = window.percentile(50), window.percentile(95)
+            latency[f"{backend}:{kind}"] = {
+                "samples": len(window),
+                "p50_s": round(p50, 3) if p50 is not None else None,
+                "p95_s": round(p95, 3) if p95 is not None else None,
+                "hedge_after_s": self.hedge_after(backend, kind),
+            }
+        return {
+            "routes": self.routes,
+            "calls": self.calls,
+            "calls_by_backend": dict(self._calls_by_backend),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "latency": latency,
+        }
+
+    async def awarm_up(self) -> None:
+        await asyncio.gather(*(b.awarm_up() for b in self.backends.values()))
+
+    def generate_json(self, prompt: str) -> dict:
+        # Sync path: routed but not hedged
+        return self.backends[self._route()[0]].generate_json(prompt)
+
+    def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        return self.backends[self._route()[0]].generate_image_b64(prompt, size)
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        return await self._race("json", lambda b: b.agenerate_json(prompt))
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        return await self._race("image", lambda b: b.agenerate_image_b64(prompt, size))
+
+
+class MockFallbackProvider(AIProvider):
+    """Last resort: serve MockProvider output when the real chain fails. Only installed when explicitly enabled.
+
+    Sits outside the prompt cache, so placeholder responses are never cached.
+    """
+
+    def __init__(self, inner: AIProvider):
+        self.inner = inner
+        self.mock = MockProvider()
+        self.fallbacks = 0
+
+    def _fallback(self, kind: str, e: Exception) -> None:
+        self.fallbacks += 1
+        logger.warning("provider %s call failed, serving mock output: %s", kind, e)
+
+    def generate_json(self, prompt: str) -> dict:
+        try:
+            return self.inner.generate_json(prompt)
+        except Exception as e:
+            self._fallback("json", e)
+            return self.mock.generate_json(prompt)
+
+    def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        try:
+            return self.inner.generate_image_b64(prompt, size)
+        except Exception as e:
+            self._fallback("image", e)
+            return self.mock.generate_image_b64(prompt, size)
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        try:
+            return await self.inner.agenerate_json(prompt)
+        except Exception as e:
+            self._fallback("json", e)
+            return self.mock.generate_json(prompt)
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        try:
+            return await self.inner.agenerate_image_b64(prompt, size)
+        except Exception as e:
+            self._fallback("image", e)
+            return self.mock.generate_image_b64(prompt, size)
@@ -0,0 +1,125 @@
+import asyncio
+import random
+import time
+from typing import Optional, Tuple
+from .mock_provider import MockProvider
+
+
+class SimulatedProviderError(RuntimeError):
+    """Injected upstream failure (carries a 503 so the resilience layer treats it as transient)."""
+    status_code = 503
+
+
+def parse_latency(spec: str) -> Tuple[str, float, float]:
+    """Latency distribution spec in milliseconds.
+
+    "fixed:800", "uniform:300:1500" or "lognormal:800:0.5" (median ms, sigma).
+    """
+    parts = spec.split(":")
+    kind = parts[0].strip().lower()
+    nums = [float(x) for x in parts[1:]]
+    if kind == "fixed" and len(nums) == 1:
+        return kind, nums[0], 0.0
+    if kind in ("uniform", "lognormal") and len(nums) == 2:
+        return kind, nums[0], nums[1]
+    raise ValueError(f"bad latency spec: {spec!r}")
+
+
+_HOOKS = ["Game on.", "Your move, builders.", "Clock's running.", "Gold-medal ideas wanted.", "Fourth quarter energy."]
+_BODIES = [
+    "Bring your best idea, ship a demo, and join builders worldwide.",
+    "Form a team, build with AI, and show the world what you made in a weekend.",
+    "Mentors, prizes and a global community are waiting for your demo.",
+]
+_CTAS = ["Apply now + invite a friend.", "Register your team today.", "Join Hack-Nation: apply before spots fill up."]
+_OVERLAYS = ["Game On: Hack-Nation", "Build. Ship. Win.", "Your AI Hackathon Moment", "Go For Gold With AI"]
+_TAGS = ["#HackNation", "#AI", "#Hackathon", "#BuildWithAI", "#GameOn", "#Builders", "#TeamWork", "#Innovation"]
+
+
+class SimulatedProvider(MockProvider):
+    """MockProvider with realistic latency, failures and randomized payloads, for load tests.
+
+    Nothing here calls the network: latency is slept, errors are raised.
+    """
+
+    def __init__(
+        self,
+        text_latency: str = "lognormal:1500:0.4",
+        image_latency: str = "lognormal:8000:0.3",
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_s: float = 60.0,
+        seed: Optional[int] = None,
+    ):
+        self.text_latency = parse_latency(text_latency)
+        self.image_latency = parse_latency(image_latency)
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_s = timeout_s
+        self.rng = random.Random(seed)
+
+    def _sample_s(self, dist: Tuple[str, float, float]) -> float:
+        kind, a, b = dist
+        if kind == "fixed":
+            ms = a
+        elif kind == "uniform":
+            ms = self.rng.uniform(a, b)
+        else:
+            ms = self.rng.lognormvariate(0.0, b) * a
+        return max(0.0, ms) / 1000.0
+
+    def _plan(self, dist: Tuple[str, float, float]) -> Tuple[float, Optional[BaseException]]:
+        """How long this call takes and what (if anything) it fails with."""
+        r = self.rng.random()
+        if r < self.timeout_rate:
+            return self.timeout_s, TimeoutError(f"simulated timeout after {self.timeout_s}s")
+        if r < self.timeout_rate + self.error_rate:
+            return self._sample_s(dist), SimulatedProviderError("simulated upstream error")
+        return self._sample_s(dist), None
+
+    def _randomize(self, prompt: str, data: dict) -> dict:
+        rng = self.rng
+        if "caption" in data:
+            tags = " ".join(rng.sample(_TAGS, rng.randint(3, 6))) if "platform: instagram" in prompt.lower() else ""
+            data = {
+                "caption": f"{rng.choice(_HOOKS)} {rng.choice(_BODIES)}\n\n{rng.choice(_CTAS)}" + (f"\n\n{tags}" if tags else ""),
+                "text_overlay": rng.choice(_OVERLAYS),
+                "image_prompt": data["image_prompt"] + f" Variation {rng.randint(1, 10**6)}.",
+            }
+        elif "postability" in data:
+            data = {**data, **{k: rng.randint(3, 5) for k in ("brand_consistency", "clarity", "cta_strength", "image_text_readability")}}
+            data["postability"] = "yes" if min(data[k] for k in ("brand_consistency", "clarity", "cta_strength")) >= 4 else "no"
+        elif "overall_score" in data:
+            data = {**data, **{k: rng.randint(60, 95) for k in ("brand_fit", "clarity", "cta_effectiveness", "visual_readability")}}
+            data["overall_score"] = round(0.35 * data["brand_fit"] + 0.3 * data["clarity"] + 0.2 * data["cta_effectiveness"] + 0.15 * data["visual_readability"])
+        elif "results" in data:
+            data = {"results": [self._randomize(prompt, {**r, "overall_score": 0}) | {"index": r["index"]} for r in data["results"]]}
+        return data
+
+    def generate_json(self, prompt: str) -> dict:
+        delay, err = self._plan(self.text_latency)
+        time.sleep(delay)
+        if err:
+            raise err
+        return self._randomize(prompt, super().generate_json(prompt))
+
+    def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        delay, err = self._plan(self.image_latency)
+        time.sleep(delay)
+        if err:
+            raise err
+        return super().generate_image_b64(prompt, size)
+
+    async def agenerate_json(self, prompt: str) -> dict:
+        delay, err = self._plan(self.text_latency)
+        await asyncio.sleep(delay)
+        if err:
+            raise err
+        return self._randomize(prompt, MockProvider.generate_json(self, prompt))
+
+    async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+        delay, err = self._plan(self.image_latency)
+        await asyncio.sleep(delay)
+        if err:
+            raise err
+        return MockProvider.generate_image_b64(self, prompt, size)
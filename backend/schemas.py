@@ -1,8 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
 from typing import List, Literal, Optional, Dict, Any
 
 EventType = Literal["Super Bowl", "Olympics"]
 PlatformType = Literal["LinkedIn", "Instagram"]
+JudgeMode = Literal["per_variant", "batch"]
 
 class GenerateRequest(BaseModel):
     intent: str = Field(..., description="What the user wants to post")
@@ -10,15 +11,46 @@ class GenerateRequest(BaseModel):
     platform: PlatformType
     constraints: Optional[Dict[str, Any]] = Field(default=None, description="Optional: date, tone, CTA, etc.")
     rag_payload: Optional[Dict[str, Any]] = Field(default=None, description="Optional: speaker names, prizes, etc.")
+    judge_mode: JudgeMode = Field(default="per_variant", description="per_variant: one judge call per variant; batch: one listwise call for all")
+    judge_gate: bool = Field(default=False, description="Don't judge variants that still break a hard validator rule (they rank last)")
+    max_iters: int = Field(default=2, ge=0, le=5, description="Max critique/revise rounds per variant")
+    min_score: int = Field(default=5, ge=1, le=5, description="Stop early once every critique axis reaches this and the post is postable")
+    max_calls: Optional[int] = Field(default=None, ge=1, description="Optional: model-call budget for the whole request")
+    max_tokens: Optional[int] = Field(default=None, ge=1, description="Optional: estimated token budget for the whole request")
+    include_timings: bool = Field(default=False, description="Attach a per-stage timing breakdown to the response")
+    deadline_s: Optional[float] = Field(default=None, gt=0, le=600, description="Optional: latency target; optional stages are degraded to return within it")
+    speculative_image: bool = Field(default=False, description="Start each draft's image during the critique loop; reused if image_prompt barely changes")
+    candidates: Optional[int] = Field(default=None, ge=1, le=12, description="Over-generate this many text drafts and keep only the most distinct, best pre-ranked ones")
+
+class BatchGenerateRequest(BaseModel):
+    items: List[GenerateRequest] = Field(..., min_length=1, max_length=200, description="Generate requests run as one campaign batch")
 
 class RefineRequest(BaseModel):
-    selected_post: Dict[str, Any] = Field(..., description="The chosen post object to refine")
+    variant_id: Optional[str] = Field(default=None, description="Id of a variant returned by /generate or /refine")
+    selected_post: Optional[Dict[str, Any]] = Field(default=None, description="Legacy: the full post object to refine (used when variant_id is not given)")
     feedback: str = Field(..., description="User feedback for edits")
+    max_calls: Optional[int] = Field(default=None, ge=1, description="Optional: model-call budget for the whole request")
+    max_tokens: Optional[int] = Field(default=None, ge=1, description="Optional: estimated token budget for the whole request")
+    include_timings: bool = Field(default=False, description="Attach a per-stage timing breakdown to the response")
+    deadline_s: Optional[float] = Field(default=None, gt=0, le=600, description="Optional: latency target; optional stages are degraded to return within it")
+
+    @model_validator(mode="after")
+    def _needs_post(self):
+        if not self.variant_id and not self.selected_post:
+            raise ValueError("either variant_id or selected_post is required")
+        return self
 
 class BrandProfile(BaseModel):
     brand_voice: Dict[str, Any]
     visual_identity: Dict[str, Any]
     language_rules: Dict[str, Any]
+    _prompt_json: Optional[str] = PrivateAttr(default=None)
+
+    def prompt_json(self) -> str:
+        # Serialized once and reused by every prompt of the request; profiles are not mutated after inference
+        if self._prompt_json is None:
+            self._prompt_json = self.model_dump_json()
+        return self._prompt_json
 
 class Critique(BaseModel):
     brand_consistency: int = Field(..., ge=1, le=5)
@@ -38,10 +70,15 @@ class JudgeResult(BaseModel):
     rationale: str
 
 class PostVariant(BaseModel):
+    id: Optional[str] = None  # assigned when the variant is stored server-side (see store.py)
+    parent_id: Optional[str] = None  # for refinements: id of the variant it was refined from
     platform: PlatformType
     caption: str
     text_overlay: str
     image_prompt: str
-    background_image_b64: Optional[str] = None  # base64-encoded PNG (OpenAI) or SVG (mock)
+    background_image_b64: Optional[str] = None  # legacy inline image; responses carry image_id/image_url instead
+    image_id: Optional[str] = None  # sha256 of the image bytes in the server-side image store
+    image_url: Optional[str] = None  # GET path serving the image (relative to the API base URL)
     critiques: List[Critique] = Field(default_factory=list)
     judge: Optional[JudgeResult] = None
+    violations: List[Dict[str, Any]] = Field(default_factory=list)  # local rule checks still failing (see validator.py)
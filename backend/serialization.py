@@ -0,0 +1,52 @@
+"""Single-pass JSON encoding for API responses, job results and stream lines.
+
+Pipeline results keep their Pydantic models (variants, brand profile) instead of
+dumping them to dicts; pydantic-core's Rust serializer encodes the whole
+structure, models included, in one pass. Endpoints return `FastJSONResponse`
+instances directly, which also skips FastAPI's `jsonable_encoder` walk.
+"""
+from typing import Any
+from pydantic_core import to_json
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def dumps(obj: Any) -> bytes:
+    return to_json(obj)
+
+
+def dumps_str(obj: Any) -> str:
+    return to_json(obj).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+
+class _NoImageGZipResponder(GZipResponder):
+    # Images pass through untouched: PNG/WebP are already compressed (gzip only costs CPU), and a stored
+    # image's strong ETag must name exactly one representation
+    async def send_with_gzip(self, message: Message) -> None:
+        await super().send_with_gzip(message)
+        if message["type"] == "http.response.start":
+            if Headers(raw=message["headers"]).get("content-type", "").startswith("image/"):
+                self.content_encoding_set = True
+
+
+class GZipExceptStreams(GZipMiddleware):
+    """GZip for large responses, except streaming endpoints (the compressor would hold back events until
+    its buffer fills) and images."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, compresslevel: int = 6, skip_paths: tuple = ()):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.skip_paths or "gzip" not in Headers(scope=scope).get("Accept-Encoding", ""):
+            await self.app(scope, receive, send)
+            return
+        responder = _NoImageGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        await responder(scope, receive, send)
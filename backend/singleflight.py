@@ -0,0 +1,77 @@
+"""Coalesce identical in-flight async work ("singleflight").
+
+The first caller for a key starts the work as a task; callers arriving while it
+runs await the same task instead of repeating it. Everyone gets the result or
+the exception. A waiter that is cancelled only detaches: the shared task is
+cancelled once no waiter is left.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+from backend.metrics import SINGLEFLIGHT_SHARED
+
+T = TypeVar("T")
+
+
+def request_key(*parts: Any) -> str:
+    """Stable key for JSON-able parts (dicts are key-sorted)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Per-event-loop table of in-flight tasks keyed by the caller.
+
+    `share` copies the result handed to followers (default: deep copy), so a
+    caller mutating what it got back cannot affect the others.
+    """
+
+    def __init__(self, scope: str, share: Callable[[Any], Any] = copy.deepcopy):
+        self.scope = scope
+        self.share = share
+        self.shared = 0
+        self._flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, _Flight]]" = weakref.WeakKeyDictionary()
+
+    def _table(self) -> Dict[Hashable, _Flight]:
+        loop = asyncio.get_running_loop()
+        table = self._flights.get(loop)
+        if table is None:
+            table = self._flights[loop] = {}
+        return table
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        table = self._table()
+        flight = table.get(key)
+        leader = flight is None
+        if leader:
+            # The task copies the leader's context (run budget, current stage), so the work is charged to it
+            flight = table[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda _t: table.pop(key, None) if table.get(key) is flight else None)
+        else:
+            self.shared += 1
+            SINGLEFLIGHT_SHARED.inc(scope=self.scope)
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+                table.pop(key, None)
+            raise
+        finally:
+            flight.waiters -= 1
+        return result if leader else self.share(result)
+
+    def stats(self) -> Dict[str, int]:
+        return {"shared": self.shared}
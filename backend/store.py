@@ -0,0 +1,186 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+from pydantic import BaseModel
+from backend.schemas import BrandProfile, PostVariant
+
+
+class VariantNotFound(LookupError):
+    """No stored variant under the requested id (expired from the LRU or never stored)."""
+
+
+class VariantRecord(BaseModel):
+    id: str
+    event: str
+    brand_id: str
+    variant: PostVariant
+    parent_id: Optional[str] = None  # set for refinements: the variant this one was refined from
+    feedback: Optional[str] = None   # human feedback that produced this refinement
+    created_at: float
+
+
+class VariantStore:
+    """Brand profiles and variants kept server-side under stable ids.
+
+    A bounded in-memory LRU sits in front of an optional SQLite table, so /refine
+    can work from a `variant_id` without the client re-uploading the post or the
+    server re-inferring the brand.
+
+    The table is pruned as rows are inserted: rows older than `ttl_s` and, past
+    `max_rows`, the oldest rows are deleted. Each row counts the stored rows that
+    point at it (refinements of a variant, variants of a brand) and is only
+    deleted once that count is zero, so a surviving variant keeps its brand and
+    its whole lineage.
+    """
+
+    PRUNE_EVERY = 50  # inserts between prunes
+    PRUNE_BATCH = 500  # max rows deleted per prune
+
+    def __init__(self, max_entries: int = 1000, path: Optional[str] = None, max_rows: int = 100_000, ttl_s: float = 30 * 24 * 3600):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl_s = ttl_s
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, data TEXT NOT NULL, created REAL NOT NULL)")
+            columns = {r[1] for r in self._db.execute("PRAGMA table_info(records)")}
+            if "refs" not in columns:
+                self._db.execute("ALTER TABLE records ADD COLUMN parent TEXT")
+                self._db.execute("ALTER TABLE records ADD COLUMN brand TEXT")
+                self._db.execute("ALTER TABLE records ADD COLUMN refs INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS records_prune ON records(refs, created)")
+
+    def _put(self, key: str, data: str, refs: Sequence[str] = ()) -> None:
+        """Store `data` under `key`; `refs` are the keys of rows it points at (kept while it exists)."""
+        with self._lock:
+            self._mem[key] = data
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+            if self._db is None:
+                return
+            parent = next((r for r in refs if r.startswith("variant:")), None)
+            brand = next((r for r in refs if r.startswith("brand:")), None)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # A re-put (brands are content-addressed and re-put often, replays re-put variants) only
+                # refreshes the row: its own `refs` and the ones it holds on parent/brand were counted on insert
+                inserted = self._db.execute(
+                    "INSERT INTO records (id, data, created, parent, brand) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO NOTHING",
+                    (key, data, time.time(), parent, brand),
+                ).rowcount
+                if inserted:
+                    for ref in (parent, brand):
+                        if ref is not None:
+                            self._db.execute("UPDATE records SET refs = refs + 1 WHERE id = ?", (ref,))
+                else:
+                    self._db.execute("UPDATE records SET data = ?, created = ? WHERE id = ?", (data, time.time(), key))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._puts += 1
+            if self._puts % self.PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self) -> int:
+        # Caller holds self._lock. Only unreferenced rows go; a parent whose last child was
+        # deleted becomes unreferenced and goes on a later prune if it is also old.
+        assert self._db is not None
+        now = time.time()
+        total = self._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        excess = max(0, total - self.max_rows)
+        victims = self._db.execute(
+            "SELECT id, parent, brand FROM records WHERE refs = 0 AND created < ? ORDER BY created LIMIT ?",
+            (now - self.ttl_s, self.PRUNE_BATCH),
+        ).fetchall()
+        if len(victims) < excess:
+            seen = {v[0] for v in victims}
+            more = self._db.execute(
+                "SELECT id, parent, brand FROM records WHERE refs = 0 ORDER BY created LIMIT ?",
+                (min(excess, self.PRUNE_BATCH),),
+            ).fetchall()
+            victims += [v for v in more if v[0] not in seen][: excess - len(victims)]
+        if not victims:
+            return 0
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for key, parent, brand in victims:
+                self._db.execute("DELETE FROM records WHERE id = ? AND refs = 0", (key,))
+                for ref in (parent, brand):
+                    if ref is not None:
+                        self._db.execute("UPDATE records SET refs = refs - 1 WHERE id = ? AND refs > 0", (ref,))
+                self._mem.pop(key, None)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return len(victims)
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                return data
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT data FROM records WHERE id = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._mem[key] = row[0]
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+            return row[0]
+
+    def put_brand(self, brand: BrandProfile) -> str:
+        data = brand.model_dump_json()
+        brand_id = hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]  # content-addressed: same profile, same id
+        self._put(f"brand:{brand_id}", data)
+        return brand_id
+
+    def get_brand(self, brand_id: str) -> Optional[BrandProfile]:
+        data = self._get(f"brand:{brand_id}")
+        return BrandProfile.model_validate_json(data) if data else None
+
+    def put_variant(self, variant: PostVariant, event: str, brand_id: str, parent_id: Optional[str] = None, feedback: Optional[str] = None) -> VariantRecord:
+        """Persist `variant` under a new id (also written to `variant.id`)."""
+        variant.id = uuid.uuid4().hex
+        variant.parent_id = parent_id
+        record = VariantRecord(id=variant.id, event=event, brand_id=brand_id, variant=variant, parent_id=parent_id, feedback=feedback, created_at=time.time())
+        refs = [f"brand:{brand_id}"] + ([f"variant:{parent_id}"] if parent_id else [])
+        self._put(f"variant:{variant.id}", record.model_dump_json(), refs)
+        return record
+
+    def put_record(self, record: VariantRecord) -> None:
+        """Store an existing record under its own id (replaying a recorded refine)."""
+        refs = [f"brand:{record.brand_id}"] + ([f"variant:{record.parent_id}"] if record.parent_id else [])
+        self._put(f"variant:{record.id}", record.model_dump_json(), refs)
+
+    def get_variant(self, variant_id: str) -> Optional[VariantRecord]:
+        data = self._get(f"variant:{variant_id}")
+        return VariantRecord.model_validate_json(data) if data else None
+
+    def lineage(self, variant_id: str, max_depth: int = 50) -> List[Dict[str, Any]]:
+        """Refinement chain from `variant_id` back to the originally generated variant."""
+        chain: List[Dict[str, Any]] = []
+        current: Optional[str] = variant_id
+        while current and len(chain) < max_depth:
+            record = self.get_variant(current)
+            if record is None:
+                break
+            chain.append({"id": record.id, "parent_id": record.parent_id, "feedback": record.feedback, "created_at": record.created_at})
+            current = record.parent_id
+        return chain
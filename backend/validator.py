@@ -0,0 +1,124 @@
+"""Deterministic checks for the mechanical rules spelled out in prompts.py.
+
+Pure Python with precompiled regexes so it can run on every draft, before every
+critique and in front of the judge pass without noticeable cost.
+"""
+import re
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, List, Optional
+from backend.schemas import BrandProfile, PostVariant
+
+MAX_OVERLAY_WORDS = 8
+INSTAGRAM_HASHTAGS = (3, 8)
+LINKEDIN_MAX_PARAGRAPHS = 3
+
+_EMOJI = re.compile(
+    "["
+    "\U0001F000-\U0001FAFF"  # pictographs, emoticons, transport, symbols & pictographs ext.
+    "\u2600-\u27BF"          # misc symbols, dingbats
+    "\u2B00-\u2BFF"          # arrows/stars
+    "\uFE0F\u200D"           # variation selector, ZWJ
+    "]"
+)
+_HASHTAG = re.compile(r"(?<!\w)#\w+")
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_CTA = re.compile(
+    r"\b(apply|register|sign[\s-]?up|join|enrol+|submit|learn more|link in bio|visit|book|rsvp|"
+    r"save your spot|get started|tag|share|comment|dm us|invite)\b",
+    re.IGNORECASE,
+)
+# must_include entries that describe a requirement instead of a literal term
+_META_TERMS = {"call to action", "cta", "hashtags", "emoji", "emojis"}
+
+
+@dataclass(frozen=True)
+class Violation:
+    rule: str
+    field: str
+    message: str
+    severity: str = "error"  # "error": hard platform/format rule; "warning": content rule
+    fixable: bool = False    # autofix() can repair it without a model call
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _paragraphs(caption: str) -> List[str]:
+    return [p for p in _PARAGRAPH_SPLIT.split(caption.strip()) if p.strip()]
+
+
+def _must_include(language_rules: Optional[Dict[str, Any]]) -> List[str]:
+    terms = (language_rules or {}).get("must_include") or []
+    if isinstance(terms, str):
+        terms = [terms]
+    return [t for t in terms if isinstance(t, str) and t.strip() and t.strip().lower() not in _META_TERMS]
+
+
+def validate(platform: str, caption: str, text_overlay: str, language_rules: Optional[Dict[str, Any]] = None) -> List[Violation]:
+    out: List[Violation] = []
+
+    if _EMOJI.search(text_overlay):
+        out.append(Violation("overlay_emoji", "text_overlay", "text_overlay must not contain emojis", fixable=True))
+    n_words = len(_EMOJI.sub("", text_overlay).split())
+    if n_words > MAX_OVERLAY_WORDS:
+        out.append(Violation("overlay_length", "text_overlay", f"text_overlay has {n_words} words (max {MAX_OVERLAY_WORDS})", fixable=True))
+
+    if platform == "Instagram":
+        lo, hi = INSTAGRAM_HASHTAGS
+        n_tags = len(_HASHTAG.findall(caption))
+        if n_tags > hi:
+            out.append(Violation("hashtag_count", "caption", f"{n_tags} hashtags (Instagram: {lo}-{hi} at the end)", fixable=True))
+        elif n_tags < lo:
+            out.append(Violation("hashtag_count", "caption", f"{n_tags} hashtags (Instagram: {lo}-{hi} at the end)"))
+    elif platform == "LinkedIn":
+        n_paras = len(_paragraphs(caption))
+        if n_paras > LINKEDIN_MAX_PARAGRAPHS:
+            out.append(Violation("paragraph_count", "caption", f"{n_paras} paragraphs (LinkedIn: max {LINKEDIN_MAX_PARAGRAPHS})", fixable=True))
+
+    if not _CTA.search(caption):
+        out.append(Violation("missing_cta", "caption", "caption has no clear call to action", severity="warning"))
+
+    lowered = caption.lower() + "\n" + text_overlay.lower()
+    for term in _must_include(language_rules):
+        if not re.search(r"(?<!\w)" + re.escape(term.lower()) + r"(?!\w)", lowered):
+            out.append(Violation("must_include", "caption", f"missing required term: {term}", severity="warning"))
+    return out
+
+
+def validate_post(post: PostVariant, brand: Optional[BrandProfile] = None) -> List[Violation]:
+    return validate(post.platform, post.caption, post.text_overlay, brand.language_rules if brand else None)
+
+
+def autofix(post: PostVariant) -> List[str]:
+    """Repair fixable violations in place. Returns the rules that were fixed."""
+    fixed: List[str] = []
+
+    overlay = _EMOJI.sub("", post.text_overlay)
+    if overlay != post.text_overlay:
+        fixed.append("overlay_emoji")
+    words = overlay.split()
+    if len(words) > MAX_OVERLAY_WORDS:
+        words = words[:MAX_OVERLAY_WORDS]
+        fixed.append("overlay_length")
+    post.text_overlay = " ".join(words)
+
+    if post.platform == "Instagram":
+        tags = _HASHTAG.findall(post.caption)
+        if len(tags) > INSTAGRAM_HASHTAGS[1]:
+            body = _HASHTAG.sub("", post.caption).rstrip()
+            body = re.sub(r"[ \t]+\n", "\n", re.sub(r"[ \t]{2,}", " ", body))
+            post.caption = body + "\n\n" + " ".join(tags[:INSTAGRAM_HASHTAGS[1]])
+            fixed.append("hashtag_count")
+    elif post.platform == "LinkedIn":
+        paras = _paragraphs(post.caption)
+        if len(paras) > LINKEDIN_MAX_PARAGRAPHS:
+            # Fold the overflow into the last allowed paragraph (keeps the CTA at the end)
+            keep = paras[:LINKEDIN_MAX_PARAGRAPHS - 1]
+            tail = " ".join(p.strip().replace("\n", " ") for p in paras[LINKEDIN_MAX_PARAGRAPHS - 1:])
+            post.caption = "\n\n".join(p.strip() for p in keep + [tail])
+            fixed.append("paragraph_count")
+    return fixed
+
+
+def has_errors(violations: Iterable[Violation]) -> bool:
+    return any(v.severity == "error" for v in violations)
@@ -0,0 +1,160 @@
+"""Load-test harness for the FastAPI backend.
+
+Drives /generate (and/or /refine) at a fixed concurrency and reports throughput,
+p50/p95/p99 latency, model calls per request and payload bytes. By default the app
+runs in-process against the simulated provider (no network, no API spend):
+
+    python -m benchmarks.loadtest --requests 60 --concurrency 12 --out .data/bench/base.json
+    python -m benchmarks.loadtest --body '{"judge_mode": "batch"}' --baseline .data/bench/base.json
+
+Simulated latency/failures come from the SIM_* env vars (see backend/config.py).
+Pass --url to hit a running server instead.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+INTENTS = [
+    "Announce Hack-Nation and invite teams to apply.",
+    "Highlight the prizes and mentors, push registrations before the deadline.",
+    "Celebrate last year's winners and tease this year's challenge.",
+]
+EVENTS = ["Super Bowl", "Olympics"]
+PLATFORMS = ["LinkedIn", "Instagram"]
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile: the smallest value with at least p% of the samples at or below it."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p * len(sorted_values) / 100.0) - 1))
+    return sorted_values[k]
+
+
+def _client(url: Optional[str]) -> httpx.AsyncClient:
+    timeout = httpx.Timeout(600.0)
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=timeout)
+    # In-process: default to the simulated provider with the prompt cache off, so every call pays latency
+    os.environ.setdefault("AI_PROVIDER", "simulated")
+    os.environ.setdefault("PROVIDER_CACHE", "0")
+    from backend.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    extra = json.loads(args.body) if args.body else {}
+    combos = itertools.cycle(itertools.product(INTENTS, EVENTS, PLATFORMS))
+    samples: List[Dict[str, Any]] = []
+
+    async with _client(args.url) as client:
+        refine_ids: List[str] = []
+        if args.scenario in ("refine", "mixed"):
+            r = await client.post("/generate", json={"intent": INTENTS[0], "event": "Super Bowl", "platform": "LinkedIn", **extra})
+            r.raise_for_status()
+            refine_ids = [v["id"] for v in r.json()["variants"]]
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(i)
+
+        async def one(i: int) -> None:
+            refine = args.scenario == "refine" or (args.scenario == "mixed" and i % 4 == 3)
+            if refine:
+                path, body = "/refine", {"variant_id": refine_ids[i % len(refine_ids)], "feedback": "Make it punchier."}
+            else:
+                intent, event, platform = next(combos)
+                path, body = "/generate", {"intent": intent, "event": event, "platform": platform, **extra}
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(path, json=body)
+                elapsed = time.perf_counter() - t0
+                usage = r.json().get("usage", {}) if r.headers.get("content-type", "").startswith("application/json") else {}
+                samples.append({
+                    "path": path,
+                    "status": r.status_code,
+                    "latency_s": elapsed,
+                    "bytes": len(r.content),
+                    "model_calls": usage.get("model_calls"),
+                })
+            except httpx.HTTPError as e:
+                samples.append({"path": path, "status": None, "latency_s": time.perf_counter() - t0, "bytes": 0, "model_calls": None, "error": str(e)})
+
+        async def worker() -> None:
+            while not queue.empty():
+                await one(queue.get_nowait())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    ok = [s for s in samples if s["status"] == 200]
+    lat = sorted(s["latency_s"] for s in ok)
+    calls = [s["model_calls"] for s in ok if s["model_calls"] is not None]
+    summary = {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "latency_p50_s": percentile(lat, 50),
+        "latency_p95_s": percentile(lat, 95),
+        "latency_p99_s": percentile(lat, 99),
+        "latency_max_s": lat[-1] if lat else None,
+        "model_calls_per_request": round(sum(calls) / len(calls), 2) if calls else None,
+        "payload_bytes_mean": round(sum(s["bytes"] for s in ok) / len(ok)) if ok else None,
+    }
+    config = {
+        "scenario": args.scenario,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "body": extra,
+        "url": args.url,
+        "env": {k: v for k, v in os.environ.items() if k.startswith(("AI_PROVIDER", "SIM_", "PROVIDER_", "MAX_CONCURRENCY", "BREAKER_"))},
+    }
+    return {"config": config, "summary": summary, "samples": samples}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    lines = []
+    for key, now in current["summary"].items():
+        before = baseline.get("summary", {}).get(key)
+        if isinstance(now, (int, float)) and isinstance(before, (int, float)) and before:
+            lines.append(f"  {key:<26} {before:>12.4g} -> {now:<12.4g} ({(now - before) / before:+.1%})")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--scenario", choices=["generate", "refine", "mixed"], default="generate")
+    parser.add_argument("--body", help="JSON merged into every /generate body (e.g. pipeline options)")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--out", help="Write full results (config, summary, samples) to this JSON file")
+    parser.add_argument("--baseline", help="Earlier --out file to compare the summary against")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result["summary"], indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            print("vs baseline:")
+            print("\n".join(compare(result, json.load(f))))
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0 if result["summary"]["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Prompt-size benchmark: estimated input tokens and cacheable-prefix share per stage.
+
+Runs a few /generate pipelines in-process against the simulated provider with zero
+latency and a fixed seed (randomized drafts, prompt cache off, so every call
+reaches the provider) and records each prompt with its stage.
+A prompt's shared prefix is the longest prefix it shares with any earlier
+prompt. What an upstream prompt cache actually reuses is smaller: nothing below
+its minimum cacheable prefix (`--min-prefix`, 1024 tokens for OpenAI), and above
+that only whole `--prefix-step` increments (128). Both shares are reported, so
+prompts too short to ever hit the cache show up as a 0 cacheable share:
+
+    python -m benchmarks.prompt_tokens
+    python -m benchmarks.prompt_tokens --out .data/bench/prompts.json --baseline .data/bench/prompts_before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+REQUESTS = [
+    {"intent": "Announce Hack-Nation and invite teams to apply.", "event": "Super Bowl", "platform": "LinkedIn"},
+    {"intent": "Highlight the prizes and mentors, push registrations before the deadline.", "event": "Super Bowl", "platform": "LinkedIn"},
+    {"intent": "Celebrate last year's winners and tease this year's challenge.", "event": "Olympics", "platform": "Instagram"},
+]
+
+
+def common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+async def record_prompts(body: Dict[str, Any]) -> List[Tuple[str, str]]:
+    from backend.metrics import current_stage
+    from backend.pipeline import run_generate
+    from backend.providers.base import AIProvider
+    from backend.providers.factory import set_shared_provider, shared_provider
+    from backend.schemas import GenerateRequest
+
+    calls: List[Tuple[str, str]] = []
+
+    class Recorder(AIProvider):
+        def __init__(self, inner: AIProvider):
+            self.inner = inner
+
+        def generate_json(self, prompt: str) -> dict:
+            calls.append((current_stage.get(), prompt))
+            return self.inner.generate_json(prompt)
+
+        def generate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+            return self.inner.generate_image_b64(prompt, size)
+
+        async def agenerate_json(self, prompt: str) -> dict:
+            calls.append((current_stage.get(), prompt))
+            return await self.inner.agenerate_json(prompt)
+
+        async def agenerate_image_b64(self, prompt: str, size: str = "1024x1024") -> Optional[str]:
+            return await self.inner.agenerate_image_b64(prompt, size)
+
+    set_shared_provider(Recorder(shared_provider()))
+    for req in REQUESTS:
+        await run_generate(GenerateRequest(**req, **body))
+    return calls
+
+
+def cached_tokens(shared_tokens: int, min_prefix: int, step: int) -> int:
+    """Tokens of a `shared_tokens`-long shared prefix that a provider prompt cache would serve."""
+    if shared_tokens < min_prefix:
+        return 0
+    return min_prefix + (shared_tokens - min_prefix) // max(1, step) * max(1, step)
+
+
+def summarize(calls: List[Tuple[str, str]], min_prefix: int = 1024, step: int = 128) -> Dict[str, Any]:
+    from backend.context import estimate_tokens
+
+    stages: Dict[str, Dict[str, float]] = {}
+    seen: List[str] = []
+    totals = {"tokens": 0, "shared_tokens": 0, "cached_tokens": 0}
+    for stage, prompt in calls:
+        prefix = max((common_prefix(prompt, p) for p in seen), default=0)
+        seen.append(prompt)
+        tokens = estimate_tokens(prompt)
+        shared = estimate_tokens(prompt[:prefix]) if prefix else 0
+        cached = cached_tokens(shared, min_prefix, step)
+        agg = stages.setdefault(stage, {"calls": 0, "tokens": 0, "shared_tokens": 0, "cached_tokens": 0})
+        agg["calls"] += 1
+        for key, value in (("tokens", tokens), ("shared_tokens", shared), ("cached_tokens", cached)):
+            agg[key] += value
+            totals[key] += value
+
+    def shares(a: Dict[str, float], n: int) -> Dict[str, Any]:
+        return {
+            "tokens_mean": round(a["tokens"] / n, 1) if n else None,
+            "uncached_tokens_mean": round((a["tokens"] - a["cached_tokens"]) / n, 1) if n else None,
+            "shared_prefix_share": round(a["shared_tokens"] / a["tokens"], 3) if a["tokens"] else None,
+            "cacheable_prefix_share": round(a["cached_tokens"] / a["tokens"], 3) if a["tokens"] else None,
+        }
+
+    out: Dict[str, Any] = {stage: {"calls": int(a["calls"]), **shares(a, int(a["calls"]))} for stage, a in sorted(stages.items())}
+    out["total"] = {
+        "calls": len(calls),
+        **shares(totals, len(calls)),
+        "tokens_per_request": round(totals["tokens"] / len(REQUESTS), 1),
+        "min_cacheable_prefix": min_prefix,
+    }
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--body", help="JSON merged into every /generate body (e.g. pipeline options)")
+    parser.add_argument("--out", help="Write the per-stage summary to this JSON file")
+    parser.add_argument("--baseline", help="Earlier --out file to compare against")
+    parser.add_argument("--min-prefix", type=int, default=1024, help="Provider's minimum cacheable prefix, in tokens (0: count any shared prefix)")
+    parser.add_argument("--prefix-step", type=int, default=128, help="Cache hits beyond the minimum come in increments of this many tokens")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("AI_PROVIDER", "simulated")
+    os.environ.setdefault("SIM_TEXT_LATENCY", "fixed:0")
+    os.environ.setdefault("SIM_IMAGE_LATENCY", "fixed:0")
+    os.environ.setdefault("SIM_SEED", "7")
+    os.environ["PROVIDER_CACHE"] = "0"
+    os.environ["SINGLEFLIGHT"] = "0"
+    summary = summarize(asyncio.run(record_prompts(json.loads(args.body) if args.body else {})), args.min_prefix, args.prefix_step)
+    print(json.dumps(summary, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            before = json.load(f)
+        print("vs baseline:")
+        for stage, now in summary.items():
+            old = before.get(stage)
+            if isinstance(old, dict) and "tokens_mean" in old:
+                print(f"  {stage:<18} tokens {old['tokens_mean']:>7} -> {now['tokens_mean']:<7}"
+                      f" uncached {old.get('uncached_tokens_mean')} -> {now['uncached_tokens_mean']:<7}"
+                      f" prefix share {old['cacheable_prefix_share']} -> {now['cacheable_prefix_share']}")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Replay runner: re-run recorded requests offline and compare against the recording.
+
+Record a corpus from a real server (every upstream call plus each request body):
+
+    RECORD_PATH=.data/recordings/calls.jsonl uvicorn backend.main:app
+
+then re-run its requests in-process against AI_PROVIDER=replay (no network, no
+API spend; prompt cache off, so every call is served from the log):
+
+    python -m benchmarks.replay .data/recordings/calls.jsonl --out .data/bench/replay_before.json
+    python -m benchmarks.replay .data/recordings/calls.jsonl --timing recorded --baseline .data/bench/replay_before.json
+
+Reports model calls (total and per stage), latency and judge scores for the
+recording and for the replay, plus how many prompts matched the log exactly,
+approximately or not at all. With `--timing recorded` each call takes its
+recorded latency (scaled by `--speed`), so latency reflects pipeline scheduling.
+
+`--kinds generate,refine` also replays refinements: a refine by `variant_id`
+runs against the stored variant and brand recorded with it. A refine can reuse
+an image rendered by an earlier request, so call counts match the recording
+exactly only with `--concurrency 1`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.loadtest import percentile
+
+
+def _judge_scores(entry: Dict[str, Any]) -> List[float]:
+    response = entry.get("response") or {}
+    if entry.get("stage") == "judge_batch":
+        return [r["overall_score"] for r in response.get("results", []) if isinstance(r, dict) and "overall_score" in r]
+    if entry.get("stage") == "judge" and "overall_score" in response:
+        return [response["overall_score"]]
+    return []
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def load_corpus(path: str, kinds: List[str]) -> Dict[str, Any]:
+    """Recorded requests (in order) and what the recording saw for them."""
+    from backend.providers.recording_provider import read_log
+
+    requests: List[Dict[str, Any]] = []
+    calls: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in read_log(path):
+        if entry.get("type") == "request" and entry.get("kind") in kinds:
+            requests.append(entry)
+        elif entry.get("type") == "call":
+            calls.setdefault(entry.get("run"), []).append(entry)
+    by_stage: Dict[str, int] = {}
+    upstream_s, scores = [], []
+    cancelled = 0
+    for req in requests:
+        run_calls = calls.get(req["run"], [])
+        upstream_s.append(sum(c.get("latency_s", 0.0) for c in run_calls))
+        for c in run_calls:
+            if c.get("cancelled"):
+                # Hedge losers: the replay does not hedge, so they are reported apart from the per-stage counts
+                cancelled += 1
+                continue
+            by_stage[c.get("stage", "")] = by_stage.get(c.get("stage", ""), 0) + 1
+            scores.extend(_judge_scores(c))
+    n = len(requests)
+    return {
+        "requests": requests,
+        "summary": {
+            "requests": n,
+            "calls_per_request": round(sum(by_stage.values()) / n, 2) if n else None,
+            "calls_by_stage": dict(sorted(by_stage.items())),
+            "cancelled_calls": cancelled,
+            "upstream_s_per_request": round(sum(upstream_s) / n, 3) if n else None,
+            "judge_score_mean": _mean(scores),
+        },
+    }
+
+
+async def replay(requests: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    from backend.pipeline import run_generate, run_refine, variant_store
+    from backend.providers.factory import find_layer, shared_provider
+    from backend.providers.recording_provider import ReplayProvider
+    from backend.schemas import BrandProfile, GenerateRequest, RefineRequest
+    from backend.store import VariantRecord
+
+    # Refines by variant_id need the variant (and brand) they resolved to when recorded
+    for entry in requests:
+        if entry.get("brand"):
+            variant_store.put_brand(BrandProfile.model_validate(entry["brand"]))
+        if entry.get("variant"):
+            variant_store.put_record(VariantRecord.model_validate(entry["variant"]))
+
+    samples: List[Dict[str, Any]] = []
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(entry: Dict[str, Any]) -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                if entry["kind"] == "generate":
+                    out = await run_generate(GenerateRequest(**entry["body"]))
+                    scores = [v.judge.overall_score for v in out["variants"] if v.judge is not None]
+                else:
+                    out = await run_refine(RefineRequest(**entry["body"]))
+                    judge = out["variant"].get("judge")
+                    scores = [judge["overall_score"]] if judge else []
+            except Exception as e:
+                samples.append({"run": entry["run"], "ok": False, "error": f"{type(e).__name__}: {e}"})
+                return
+            samples.append({
+                "run": entry["run"],
+                "ok": True,
+                "latency_s": time.perf_counter() - t0,
+                "judge_scores": scores,
+            })
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(e) for e in requests))
+    wall = time.perf_counter() - started
+
+    ok = [s for s in samples if s["ok"]]
+    lat = sorted(s["latency_s"] for s in ok)
+    replayer = find_layer(shared_provider(), ReplayProvider)
+    stats = replayer.stats() if replayer is not None else {}
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": sorted({s["error"] for s in samples if not s["ok"]})[:10],
+        "wall_s": round(wall, 3),
+        # Upstream attempts (retries included), counted the same way as in the recording
+        "calls_per_request": round(sum(stats.get("calls_by_stage", {}).values()) / len(ok), 2) if ok else None,
+        "calls_by_stage": dict(sorted(stats.get("calls_by_stage", {}).items())),
+        "latency_p50_s": round(percentile(lat, 50), 3) if lat else None,
+        "latency_p95_s": round(percentile(lat, 95), 3) if lat else None,
+        "judge_score_mean": _mean([x for s in ok for x in s["judge_scores"]]),
+        "prompts": {k: stats.get(k) for k in ("hits", "fuzzy_hits", "misses")},
+    }
+
+
+def _compare(label: str, before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    print(f"{label}:")
+    for key in ("calls_per_request", "latency_p50_s", "latency_p95_s", "judge_score_mean"):
+        if key in before or key in after:
+            print(f"  {key:<22} {before.get(key)} -> {after.get(key)}")
+    stages = sorted(set(before.get("calls_by_stage", {})) | set(after.get("calls_by_stage", {})))
+    for stage in stages:
+        print(f"  calls[{stage}]{'':<{max(0, 15 - len(stage))}} {before.get('calls_by_stage', {}).get(stage, 0)} -> {after.get('calls_by_stage', {}).get(stage, 0)}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="Call log recorded with RECORD_PATH")
+    parser.add_argument("--timing", choices=("none", "recorded"), default="none", help="Sleep each call's recorded latency")
+    parser.add_argument("--speed", type=float, default=1.0, help="Multiplier on recorded latencies (with --timing recorded)")
+    parser.add_argument("--strict", action="store_true", help="Fail requests whose prompts are not in the log instead of using mock output")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--kinds", default="generate", help="Comma-separated request kinds to replay (generate,refine)")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--data-dir", help="DATA_DIR for the replay (default: a fresh temp dir, so stored images/variants do not skip calls)")
+    parser.add_argument("--out", help="Write the summary to this JSON file")
+    parser.add_argument("--baseline", help="Earlier --out file to compare the replay against")
+    args = parser.parse_args(argv)
+
+    os.environ["AI_PROVIDER"] = "replay"
+    os.environ["REPLAY_PATH"] = args.log
+    os.environ["REPLAY_TIMING"] = args.timing
+    os.environ["REPLAY_SPEED"] = str(args.speed)
+    os.environ["REPLAY_STRICT"] = "1" if args.strict else "0"
+    os.environ["PROVIDER_CACHE"] = "0"
+    os.environ["DATA_DIR"] = args.data_dir or tempfile.mkdtemp(prefix="replay-")
+    # Hedges the recording made are already in the log; new ones would only add duplicate calls
+    os.environ.setdefault("HEDGE_PERCENTILE", "0")
+    os.environ.pop("RECORD_PATH", None)
+
+    corpus = load_corpus(args.log, args.kinds.split(","))
+    requests = corpus["requests"][: args.limit] if args.limit else corpus["requests"]
+    summary = {"recorded": corpus["summary"], "replayed": asyncio.run(replay(requests, args.concurrency))}
+    print(json.dumps(summary, indent=2))
+    _compare("recording vs replay", summary["recorded"], summary["replayed"])
+    if args.baseline:
+        with open(args.baseline) as f:
+            before = json.load(f)
+        _compare("baseline replay vs this replay", before["replayed"], summary["replayed"])
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,10 +2,11 @@ import base64
 import json
 import requests
 import streamlit as st
-from PIL import Image
-from io import BytesIO
 
 API_URL = st.secrets.get("API_URL", "http://localhost:8000")
+REQUEST_TIMEOUT_S = 300
+# Ask the server to degrade optional stages so it answers before we give up waiting
+DEADLINE_S = 240
 
 st.set_page_config(page_title="AI Social Media Agent", layout="wide")
 st.title("AI Social Media Agent")
@@ -18,16 +19,33 @@ with st.sidebar:
     platform = st.selectbox("Platform", ["LinkedIn", "Instagram"])
     generate_btn = st.button("Generate Posts 🚀", type="primary")
 
-def render_image(b64_str: str):
-    # mock provider returns base64-encoded SVG text; OpenAI returns base64 PNG.
-    # We try PNG decode first; if it fails, render SVG via markdown.
-    try:
-        img_bytes = base64.b64decode(b64_str)
-        img = Image.open(BytesIO(img_bytes))
-        st.image(img, use_container_width=True)
-    except Exception:
-        svg_text = base64.b64decode(b64_str).decode("utf-8", errors="ignore")
-        st.markdown(svg_text, unsafe_allow_html=True)
+@st.cache_data(max_entries=64, show_spinner=False)
+def fetch_image(url: str) -> tuple[bytes, str]:
+    # Image URLs are content-addressed / immutable variants, so caching by URL is always safe
+    r = requests.get(f"{API_URL}{url}", timeout=60)
+    r.raise_for_status()
+    return r.content, r.headers.get("content-type", "")
+
+
+def render_image(v: dict):
+    # The server renders small WebP previews (the stored post with its overlay composited once it has an id);
+    # the full-resolution asset is only downloaded when the link is opened.
+    if v.get("id") and v.get("image_url"):
+        preview, full = f"/variants/{v['id']}/image", f"/variants/{v['id']}/image?size=full"
+    elif v.get("image_url"):
+        preview, full = f"{v['image_url']}?size=preview", v["image_url"]
+    elif v.get("background_image_b64"):
+        data = base64.b64decode(v["background_image_b64"])
+        if data.lstrip().startswith(b"<svg"):
+            st.markdown(data.decode("utf-8", errors="ignore"), unsafe_allow_html=True)
+        else:
+            st.image(data, use_container_width=True)
+        return
+    else:
+        return
+    data, _ = fetch_image(preview)
+    st.image(data, use_container_width=True)
+    st.markdown(f"[Full resolution]({API_URL}{full})")
 
 def score_badges(critiques):
     if not critiques:
@@ -56,15 +74,75 @@ if "selected_idx" not in st.session_state:
 if "refined" not in st.session_state:
     st.session_state.refined = None
 
-if generate_btn:
-    with st.spinner("Generating… (3 variants + 2 internal critique loops each)"):
-        r = requests.post(f"{API_URL}/generate", json={"intent": intent, "event": event, "platform": platform}, timeout=300)
+def stream_events(payload: dict):
+    # NDJSON: one pipeline event per line, emitted as soon as each stage finishes
+    with requests.post(f"{API_URL}/generate/stream", json=payload, stream=True, timeout=REQUEST_TIMEOUT_S) as r:
         r.raise_for_status()
-        data = r.json()
-        st.session_state.brand_profile = data["brand_profile"]
-        st.session_state.variants = data["variants"]
-        st.session_state.selected_idx = None
-        st.session_state.refined = None
+        for line in r.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def render_variant(v: dict, title: str):
+    st.markdown(f"### {title}")
+    render_image(v)
+    st.markdown("**Text overlay**")
+    st.code(v["text_overlay"])
+    st.markdown("**Caption**")
+    st.write(v["caption"])
+    judge_badge(v.get("judge"))
+    score_badges(v.get("critiques", []))
+    for issue in v.get("violations", []):
+        st.caption(f"⚠️ {issue['message']}")
+
+
+if generate_btn:
+    brand_slot = st.empty()
+    status = st.status("Generating… (3 variants + 2 internal critique loops each)", expanded=False)
+    slots = [col.empty() for col in st.columns(3)]
+    brand_profile, live = None, {}
+    for e in stream_events({"intent": intent, "event": event, "platform": platform, "deadline_s": DEADLINE_S}):
+        kind = e["type"]
+        if kind == "error":
+            status.update(label="Generation failed", state="error")
+            st.error(e["detail"])
+            st.stop()
+        if kind == "brand_profile":
+            brand_profile = e["brand_profile"]
+            with brand_slot.container():
+                st.subheader("Inferred Brand Profile (machine-readable)")
+                st.json(brand_profile)
+            continue
+        if kind == "done":
+            for j, variant_id in enumerate(e["variant_ids"]):
+                live[j]["id"] = variant_id
+            st.session_state.brand_profile = brand_profile
+            st.session_state.variants = [live[i] for i in e["order"]]
+            st.session_state.selected_idx = None
+            st.session_state.refined = None
+            if e["usage"].get("degradations"):
+                st.info("Shortened to meet the deadline: " + ", ".join(e["usage"]["degradations"]))
+            break
+        i = e["index"]
+        if kind == "draft":
+            live[i] = e["variant"]
+        elif kind == "critique":
+            live[i]["critiques"].append(e["critique"])
+        elif kind == "revision":
+            live[i].update(caption=e["caption"], text_overlay=e["text_overlay"], image_prompt=e["image_prompt"])
+        elif kind == "image":
+            live[i].update(image_id=e["image_id"], image_url=e["image_url"])
+        elif kind == "judge":
+            live[i]["judge"] = e["judge"]
+        status.update(label=f"Generating… variant {i+1}: {kind}")
+        if i < len(slots):
+            with slots[i].container():
+                render_variant(live[i], f"Variant {i+1} · {kind}")
+    status.update(label="Done", state="complete")
+    # Final ranked view (with select buttons) is rendered below
+    brand_slot.empty()
+    for slot in slots:
+        slot.empty()
 
 if st.session_state.brand_profile:
     st.subheader("Inferred Brand Profile (machine-readable)")
@@ -78,15 +156,7 @@ if st.session_state.variants:
             title = f"Variant {i+1}"
             if i == 0 and v.get("judge"):
                 title += "  🏅 (Top scored)"
-            st.markdown(f"### {title}")
-            if v.get("background_image_b64"):
-                render_image(v["background_image_b64"])
-            st.markdown("**Text overlay**")
-            st.code(v["text_overlay"])
-            st.markdown("**Caption**")
-            st.write(v["caption"])
-            judge_badge(v.get("judge"))
-            score_badges(v.get("critiques", []))
+            render_variant(v, title)
             if st.button(f"Select Variant {i+1}", key=f"select_{i}"):
                 st.session_state.selected_idx = i
                 st.session_state.refined = None
@@ -97,18 +167,20 @@ if st.session_state.selected_idx is not None:
     selected = st.session_state.variants[st.session_state.selected_idx]
     feedback = st.text_input("Your feedback (tone/CTA/layout/etc.)", value="Make it punchier and add a clearer CTA.")
     if st.button("Refine Selected Variant ✨", type="primary"):
-        payload = dict(selected)
-        payload["event"] = event
+        if selected.get("id"):
+            # Server keeps the variant and its brand profile; send only the id
+            body = {"variant_id": selected["id"], "feedback": feedback, "deadline_s": DEADLINE_S}
+        else:
+            body = {"selected_post": {**selected, "event": event}, "feedback": feedback, "deadline_s": DEADLINE_S}
         with st.spinner("Refining…"):
-            r = requests.post(f"{API_URL}/refine", json={"selected_post": payload, "feedback": feedback}, timeout=300)
+            r = requests.post(f"{API_URL}/refine", json=body, timeout=REQUEST_TIMEOUT_S)
             r.raise_for_status()
             st.session_state.refined = r.json()
 
 if st.session_state.refined:
     st.subheader("Refined Output")
     v = st.session_state.refined["variant"]
-    if v.get("background_image_b64"):
-        render_image(v["background_image_b64"])
+    render_image(v)
     st.markdown("**Text overlay**")
     st.code(v["text_overlay"])
     st.markdown("**Caption**")